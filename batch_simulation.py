@@ -0,0 +1,172 @@
+# Batch Simulation - plays thousands of games at once with NumPy, one move per game per step
+# Follows the rules of Game.game_update (HIT, MISS, SUNK, ELIM_PLAYER, ELIM_TEAM, GAME_END and team turns)
+# with random shooters, for strategy and balance experiments over millions of games
+# Usage: python3 batch_simulation.py [games] [players per team] [teams] [board size]
+import sys
+import time
+from game import Game
+from placements import PlacementIndex
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed by this module
+    np = None
+
+
+# Cell indexes of every placement of a ship of the given size on a board of board_size, one row per placement
+def ship_placements(size, board_size=10):
+    return np.array(PlacementIndex.get(board_size).cells(size))
+
+
+class BatchSimulation():
+    # teams: list of team names, team_size: players on each team, game_count: games played side by side
+    # board_size and fleet (dict of ship -> ship size, Game.ship_size by default) are the same for every game
+    # Arrays of cells, ship sizes and ships use the smallest integer type holding the largest value of the game
+    def __init__(self, game_count, teams, team_size=1, seed=None, board_size=10, fleet=None):
+        if np is None:
+            raise ImportError("batch_simulation needs NumPy, install it with: pip install numpy")
+        self.game_count = game_count
+        self.board_size = board_size
+        self.cell_count = board_size * board_size
+        self.ship_size = dict(fleet or Game.ship_size)
+        self.ships = list(self.ship_size)
+        self.teams = list(teams)
+        self.player_count = len(self.teams) * team_size
+        # Team index of each player, players are grouped by team
+        self.team_of = np.repeat(np.arange(len(self.teams)), team_size)
+        self.rng = np.random.default_rng(seed)
+        self.games = np.arange(game_count)
+
+        games, players, ship_count = game_count, self.player_count, len(self.ships)
+        cell_type = np.min_scalar_type(self.cell_count)
+        ship_type = np.min_scalar_type(ship_count)
+        self.ship_at = self.place_fleets(ship_type)  # Ship number + 1 on each cell of each player's board, 0 if none
+        # Random shooters shoot each board in its own random cell order, so a cell is never shot twice
+        self.shot_order = self.rng.permuted(np.tile(np.arange(self.cell_count, dtype=cell_type), (games, players, 1)),
+                                            axis=2)
+        self.shot_count = np.zeros((games, players), dtype=cell_type)  # Cells of each board shot so far
+        self.remaining = np.tile(np.array([self.ship_size[ship] for ship in self.ships],
+                                          dtype=np.min_scalar_type(max(self.ship_size.values()))),
+                                 (games, players, 1))  # Unhit cells of each ship
+        self.ships_afloat = np.full((games, players), ship_count, dtype=ship_type)
+        self.alive = np.ones((games, players), dtype=bool)
+        self.team_players_alive = np.full((games, len(self.teams)), team_size, dtype=np.int16)
+        self.teams_alive = np.full(games, len(self.teams), dtype=np.int16)
+
+        # Turns, a random team goes first and its first player moves first
+        self.first_team = self.rng.integers(len(self.teams), size=games)
+        self.mover = self.first_team * team_size
+        self.turn_count = np.ones(games, dtype=np.int32)
+        self.done = np.zeros(games, dtype=bool)
+        self.winner = np.full(games, -1, dtype=np.int16)  # Team index of the winner, -1 while playing
+
+        # Per game counters for the result summary
+        self.moves = np.zeros(games, dtype=np.int32)
+        self.hits = np.zeros(games, dtype=np.int32)
+        self.ships_sunk = np.zeros(games, dtype=np.int32)
+        self.players_eliminated = np.zeros(games, dtype=np.int32)
+
+    # Random non-overlapping fleets for every player of every game
+    def place_fleets(self, ship_type):
+        games, players = self.game_count, self.player_count
+        ship_at = np.zeros((games * players, self.cell_count), dtype=ship_type)
+        boards = np.arange(games * players)
+        for ship_num, ship in enumerate(self.ships):
+            placements = ship_placements(self.ship_size[ship], self.board_size)
+            todo = boards
+            while todo.size:  # Redraw the placements overlapping an earlier ship
+                cells = placements[self.rng.integers(len(placements), size=todo.size)]
+                free = ~(ship_at[todo[:, None], cells] != 0).any(axis=1)
+                placed = todo[free]
+                ship_at[placed[:, None], cells[free]] = ship_num + 1
+                todo = todo[~free]
+        return ship_at.reshape(games, players, self.cell_count)
+
+    # Play one move in every game still going, returns the outcome of each move as boolean arrays
+    def step(self):
+        games = self.games[~self.done]
+        attacker = self.mover[games]
+
+        # Random living enemy of the attacker, then a random cell of theirs not shot yet
+        enemy = self.alive[games] & (self.team_of[None, :] != self.team_of[attacker][:, None])
+        defender = np.argmax(np.where(enemy, self.rng.random(enemy.shape), -1), axis=1)
+        cell = self.shot_order[games, defender, self.shot_count[games, defender]].astype(np.intp)
+        self.shot_count[games, defender] += 1
+
+        ship = self.ship_at[games, defender, cell].astype(np.intp) - 1
+        hit = ship >= 0
+        hit_games, hit_defender, hit_ship = games[hit], defender[hit], ship[hit]
+        self.remaining[hit_games, hit_defender, hit_ship] -= 1
+
+        sunk = np.zeros(games.size, dtype=bool)
+        sunk[hit] = self.remaining[hit_games, hit_defender, hit_ship] == 0
+        self.ships_afloat[games[sunk], defender[sunk]] -= 1
+
+        elim_player = sunk & (self.ships_afloat[games, defender] == 0)
+        self.alive[games[elim_player], defender[elim_player]] = False
+        defender_team = self.team_of[defender]
+        self.team_players_alive[games[elim_player], defender_team[elim_player]] -= 1
+
+        elim_team = elim_player & (self.team_players_alive[games, defender_team] == 0)
+        self.teams_alive[games[elim_team]] -= 1
+        game_end = elim_team & (self.teams_alive[games] == 1)
+        self.winner[games[game_end]] = self.team_of[attacker[game_end]]  # Only the attacker's team is left
+        self.done[games[game_end]] = True
+
+        self.moves[games] += 1
+        self.hits[games[hit]] += 1
+        self.ships_sunk[games[sunk]] += 1
+        self.players_eliminated[games[elim_player]] += 1
+
+        self.advance_turns(games[~game_end], attacker[~game_end])
+        return {"games": games, "attacker": attacker, "defender": defender, "cell": cell, "hit": hit,
+                "sunk": sunk, "elim_player": elim_player, "elim_team": elim_team, "game_end": game_end}
+
+    # Pass each move to the next living player, players of a team are next to each other so a team keeps
+    # the turn until each of its living players has moved, like Game.check_team_taken_turn
+    def advance_turns(self, games, attacker):
+        next_mover = attacker.copy()
+        found = np.zeros(games.size, dtype=bool)
+        for offset in range(1, self.player_count + 1):
+            candidate = (attacker + offset) % self.player_count
+            take = ~found & self.alive[games, candidate]
+            next_mover[take] = candidate[take]
+            found |= take
+        old_team, new_team = self.team_of[attacker], self.team_of[next_mover]
+        self.turn_count[games] += (old_team != new_team) & (new_team == self.first_team[games])
+        self.mover[games] = next_mover
+
+    # Play every game to the end, returns the result summary
+    def run(self, max_steps=None):
+        max_steps = max_steps or self.player_count * self.cell_count
+        steps = 0
+        while not self.done.all() and steps < max_steps:
+            self.step()
+            steps += 1
+        return self.summary()
+
+    # Result of every game, winner is the team name (None if unfinished)
+    def summary(self):
+        return {"winner": [self.teams[team] if team >= 0 else None for team in self.winner],
+                "moves": self.moves, "turns": self.turn_count, "hits": self.hits,
+                "ships_sunk": self.ships_sunk, "players_eliminated": self.players_eliminated}
+
+
+def main():
+    game_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    team_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    team_count = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    board_size = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    teams = Game.team_names(team_count)
+
+    start = time.perf_counter()
+    summary = BatchSimulation(game_count, teams, team_size, board_size=board_size).run()
+    elapsed = time.perf_counter() - start
+    print("Played " + str(game_count) + " games in " + format(elapsed, ".2f") + "s (" +
+          format(elapsed / game_count * 1e6, ".1f") + " us per game)")
+    print("Wins: " + str({team: summary["winner"].count(team) for team in teams + [None]}))
+    print("Average moves per game: " + format(float(summary["moves"].mean()), ".1f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# Benchmarks - micro-benchmarks of the Game and Player hot paths run on every move
+# Each benchmark runs with several team layouts and at several points of a game, on games set up and played
+# in-process by simulation.py with a fixed seed so every run measures the same states
+# Results are written as JSON, a baseline from an earlier run flags every benchmark that got slower
+# Every timing run starts from a fresh copy of its game state, so earlier runs never change what later ones measure,
+# and calls it often enough to last min_run_time. The suite goes over every benchmark in several passes and keeps
+# the fastest result of each, so a slow spell of the machine only slows down one of its measurements
+# A benchmark over the threshold is measured again in up to rechecks later rounds and only flagged if it is still
+# slower, since a busy machine slows down single benchmarks for a while
+# The threshold of a benchmark is raised to the spread of its passes (in this run or the baseline's) when that is
+# larger, and a benchmark within noise_floor nanoseconds of its baseline is never flagged, so a run compared with
+# its own results passes even on a noisy machine
+# Usage: python3 benchmarks.py [results file] [baseline file] [regression threshold %]
+import gc
+import json
+import random
+import sys
+import time
+from board import Board
+from simulation import new_game, play_game, RandomShooter
+from game import Game
+
+layouts = [(2, 1), (2, 2), (4, 1), (4, 4), (16, 8)]  # (teams, players per team)
+progresses = [0.0, 0.5, 0.9]  # Share of the game's moves played before measuring
+repeats = 5  # Timing runs of each benchmark per pass, the fastest is kept since slower runs only add noise
+passes = 3  # Passes over every benchmark, spreading the runs of each one over the whole suite
+min_run_time = 0.02  # Seconds a timing run lasts at least, calls are added until it does
+rechecks = 3  # Measurements of a benchmark over the threshold before it is flagged
+noise_floor = 200  # Nanoseconds per call a benchmark may be slower than its baseline by without being flagged
+seed = 1
+total_moves = {}  # key: (teams, players per team), value: moves of the seeded game of the layout
+
+
+def layout_name(team_count, team_size):
+    return str(team_count) + "x" + str(team_size)
+
+
+def make_teams(team_count, team_size):
+    return {team: [team + str(i) for i in range(team_size)] for team in Game.team_names(team_count)}
+
+
+# A game of the layout with progress of its moves played, the same game for the same layout every run
+def game_at(team_count, team_size, progress):
+    teams = make_teams(team_count, team_size)
+    if (team_count, team_size) not in total_moves:
+        rng = random.Random(seed)
+        total_moves[(team_count, team_size)] = play_game(new_game(teams, rng=rng), rng=rng)["moves"]
+    rng = random.Random(seed)
+    game = new_game(teams, rng=rng)
+    shooter = RandomShooter(game, rng)
+    play_game(game, shooter, rng, max_moves=int(total_moves[(team_count, team_size)] * progress))
+    return game, shooter
+
+
+# Seconds per call of the function made by make_func, fastest of repeats runs
+# Each run calls a new function from make_func, on its own fresh state, number times in a row; number is found
+# like timeit's autorange, growing 1, 2, 5, 10, 20, 50... until a run lasts min_run_time
+# The garbage collector is off while timing, like timeit, so its pauses do not land on a random benchmark
+def time_calls(make_func):
+    number = None
+    best = None
+    for i in range(repeats):
+        func = make_func()
+        if number is None:
+            number = calls_per_run(func)
+            func = make_func()
+        gc.disable()
+        start = time.perf_counter()
+        for j in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calls_per_run(func):
+    number = 1
+    while True:
+        for step in (1, 2, 5):
+            gc.disable()
+            start = time.perf_counter()
+            for j in range(number * step):
+                func()
+            elapsed = time.perf_counter() - start
+            gc.enable()
+            if elapsed >= min_run_time:
+                return number * step
+        number *= 10
+
+
+# Game.make_move, each call plays the next legal move so the game state moves on like in a real game
+# Timed a move at a time over number moves per run, continuing on a fresh copy of the game whenever it ends
+def bench_make_move(team_count, team_size, progress, number=300):
+    best = None
+    for i in range(repeats):
+        elapsed = 0
+        moves = 0
+        game = None
+        while moves < number:
+            if game is None or game.game_end:
+                game, shooter = game_at(team_count, team_size, progress)
+            team = [game.players[player_num] for player_num in game.teams[game.team_turn]]
+            attackers = [player for player in team if player.is_alive and not game.has_taken_turn(player)]
+            if not attackers:
+                break
+            defender_num, row, col = shooter.choose_move(attackers[0])
+            gc.disable()
+            start = time.perf_counter()
+            game.make_move(attackers[0], game.players[defender_num], row, col)
+            elapsed += time.perf_counter() - start
+            gc.enable()
+            moves += 1
+        if moves:
+            best = elapsed / moves if best is None else min(best, elapsed / moves)
+    return best
+
+
+# Player.update_ship_state right after a shot hit a ship still afloat, the check run after every move
+def bench_update_ship_state(team_count, team_size, progress):
+    def make_func():
+        game, shooter = game_at(team_count, team_size, progress)
+        attacker = game.players[game.teams[game.team_turn][0]]
+        defender = next(player for player in game.players.values() if player.team != attacker.team)
+        board = defender.board
+        afloat = [ship for ship in game.ships if defender.ship_state[ship]]
+        if afloat:  # Point the last shot at an afloat ship without changing the board
+            board.last_hit_ship = afloat[0]
+        return lambda: defender.update_ship_state(attacker)
+    return time_calls(make_func)
+
+
+# Player.get_grid of a board in the state of the game
+def bench_get_grid(team_count, team_size, progress):
+    def make_func():
+        game, shooter = game_at(team_count, team_size, progress)
+        return game.players[game.teams[game.team_turn][0]].get_grid
+    return time_calls(make_func)
+
+
+# Game.add_event (the state buffer update of every move) with every player subscribed for pushed events
+def bench_add_event(team_count, team_size, progress):
+    def make_func():
+        game, shooter = game_at(team_count, team_size, progress)
+        for player_num in game.players:
+            game.subscribe(player_num, lambda kind, msg: None)
+        return lambda: game.add_event("MISS Red0 Blue0 5 5")
+    return time_calls(make_func)
+
+
+# Game.change_team_turn, run when every living player of the team has moved
+def bench_change_team_turn(team_count, team_size, progress):
+    return time_calls(lambda: game_at(team_count, team_size, progress)[0].change_team_turn)
+
+
+# Binary board update of one move for an enemy, fetched by every other player after each move
+def bench_board_update(team_count, team_size, progress):
+    def make_func():
+        game, shooter = game_at(team_count, team_size, progress)
+        board = game.players[game.teams[game.team_turn][0]].board
+        since = max(board.version - 1, 0)
+        return lambda: board.encode_update(since, True)
+    return time_calls(make_func)
+
+
+benchmarks = {"make_move": bench_make_move, "update_ship_state": bench_update_ship_state,
+              "get_grid": bench_get_grid, "add_event": bench_add_event,
+              "change_team_turn": bench_change_team_turn, "board_update": bench_board_update}
+
+
+# Every benchmark with every layout and progress, key: benchmark name, value: (benchmark, layout, progress)
+def benchmark_cases():
+    cases = {}
+    for name, bench in benchmarks.items():
+        for team_count, team_size in layouts:
+            for progress in progresses:
+                key = name + " " + layout_name(team_count, team_size) + " " + format(progress, ".1f")
+                cases[key] = (bench, team_count, team_size, progress)
+    return cases
+
+
+# Run every benchmark in passes, returns the fastest nanoseconds per call of each and the spread of each
+# (how much slower its slowest pass was than its fastest, in percent)
+def run_benchmarks(cases):
+    pass_results = {key: [] for key in cases}
+    for i in range(passes):
+        for key, (bench, team_count, team_size, progress) in cases.items():
+            pass_results[key].append(bench(team_count, team_size, progress) * 1e9)
+    results = {key: min(ns_list) for key, ns_list in pass_results.items()}
+    spreads = {key: (max(ns_list) / min(ns_list) - 1) * 100 for key, ns_list in pass_results.items()}
+    return results, spreads
+
+
+# Benchmarks slower than their baseline by more than threshold percent, as (key, ns, baseline ns)
+# The threshold of each benchmark is raised to the spread of its passes in either run, and the limit is at least
+# noise_floor above the baseline
+# The slower ones are measured again in up to rechecks rounds, the fastest of all measurements counts; a round
+# goes through all of them before the next one starts, so a benchmark measured during a slow spell of the machine
+# is measured again seconds later
+def find_regressions(cases, results, spreads, baseline, baseline_spreads, threshold):
+    limits = {}
+    for key in results:
+        base = baseline.get(key, float("inf"))
+        case_threshold = max(threshold, spreads.get(key, 0), baseline_spreads.get(key, 0))
+        limits[key] = max(base * (1 + case_threshold / 100), base + noise_floor)
+    slower = [key for key in results if results[key] > limits[key]]
+    for i in range(rechecks):
+        for key in slower:
+            bench, team_count, team_size, progress = cases[key]
+            results[key] = min(results[key], bench(team_count, team_size, progress) * 1e9)
+        slower = [key for key in slower if results[key] > limits[key]]
+    return [(key, results[key], baseline[key]) for key in slower]
+
+
+def main():
+    results_file = sys.argv[1] if len(sys.argv) > 1 else "benchmark_results.json"
+    baseline_file = sys.argv[2] if len(sys.argv) > 2 else None
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 25
+
+    baseline = None
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+
+    cases = benchmark_cases()
+    results, spreads = run_benchmarks(cases)
+    regressions = []
+    if baseline:  # Baselines written before spreads were recorded are compared with the threshold alone
+        regressions = find_regressions(cases, results, spreads, baseline["results"], baseline.get("spreads", {}),
+                                       threshold)
+    print("benchmark (teams x players, progress)      ns per call   spread" + ("   vs baseline" if baseline else ""))
+    for key, ns in results.items():
+        line = key.ljust(40) + format(ns, ".0f").rjust(15) + format(spreads[key], ".0f").rjust(8) + "%"
+        if baseline and key in baseline["results"]:
+            line += format(ns / baseline["results"][key] * 100 - 100, "+.0f").rjust(13) + "%"
+        print(line)
+    with open(results_file, "w") as f:
+        json.dump({"board_size": Board().size, "python": sys.version.split()[0], "results": results,
+                   "spreads": spreads}, f, indent=2)
+    print("Results written to " + results_file)
+
+    if baseline:
+        for key, ns, baseline_ns in regressions:
+            print("REGRESSION " + key + ": " + format(ns, ".0f") + " ns, baseline " + format(baseline_ns, ".0f") + " ns")
+        if regressions:
+            sys.exit(1)
+        print("No regressions over " + format(threshold, "g") + "% (or the spread of the benchmark)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# Board - packed state of one player's board, one byte per cell and the ship on each of the few ship cells
+# Every move changes a single cell, so moves cost the same on any board size
+import struct
+
+# Binary board updates start with a kind byte and the board version:
+#   N  not modified since the version the client holds
+#   D  delta, a 4 byte count then (cell index, 1 byte cell state) for every changed cell, the cell index
+#      takes 2 bytes on boards of up to 65536 cells and 4 bytes on larger boards
+#   F  full board, a 2 byte board size then one byte per cell
+update_header = struct.Struct('!cI')
+delta_count = struct.Struct('!I')
+delta_entry = struct.Struct('!HB')
+wide_delta_entry = struct.Struct('!IB')
+full_size = struct.Struct('!H')
+
+
+class Board():
+    # Cell states
+    EMPTY = 0
+    SHIP = 1
+    HIT = 2
+    MISS = 3
+    SUNK = 4
+    cell_chars = b"-SHMX"  # Character of each cell state in the text grid
+    hide_ships_table = bytes.maketrans(bytes([SHIP]), bytes([EMPTY]))  # Enemies see ship cells as empty
+    empty_grids = {}  # key: board size, value: text grid of an empty board
+    max_size = 65535  # Largest board size a full board update can carry
+
+    def __init__(self, size=10):
+        self.size = size
+        self.cells = bytearray(size * size)  # Row major, cell (1, 1) is index 0
+        self.ship_at = {}  # key: cell index of a ship cell, value: ship number of the ship on it
+        self.ship_names = []  # Ship of each ship number
+        self.ship_cells = []  # Cell indexes of each ship number
+        self.remaining = []  # Cells of each ship number that have not been hit
+        self.ship_nums = {}  # key: ship, value: ship number
+        self.last_hit_ship = None  # Ship hit by the last shot, None if it missed
+        self.version = 0  # Incremented on every cell change
+        self.changes = []  # Cell index changed by each version, version N changed changes[N - 1]
+        # Text grid with axis labels, built on first use and then kept up to date cell by cell
+        self.text = None
+        self.label_width = len(Board.row_label(size))  # Row labels are padded to this width
+        self.header_length = len(('+ ' + ' '.join(str(col) for col in range(1, size + 1))).encode())
+
+    # Letters of a row (1 = A), rows after Z go on like spreadsheet columns: AA, AB, ...
+    @staticmethod
+    def row_label(row):
+        label = ''
+        while row > 0:
+            row, letter = divmod(row - 1, 26)
+            label = chr(ord('A') + letter) + label
+        return label
+
+    # Text grid of an empty board, built once per board size
+    @staticmethod
+    def render_empty(size):
+        if size not in Board.empty_grids:
+            Board.empty_grids[size] = Board.build_empty(size)
+        return bytearray(Board.empty_grids[size])
+
+    @staticmethod
+    def build_empty(size):
+        label_width = len(Board.row_label(size))
+        text = bytearray(('+ ' + ' '.join(str(col) for col in range(1, size + 1))).encode())
+        cells = (' ' + chr(Board.cell_chars[Board.EMPTY])) * size
+        for row in range(1, size + 1):
+            text += ('\n' + Board.row_label(row).ljust(label_width) + cells).encode()
+        return bytes(text)
+
+    # Position of a cell's character in the text grid
+    def text_offset(self, index):
+        row, col = divmod(index, self.size)
+        return self.header_length + row * (1 + self.label_width + 2 * self.size) + self.label_width + 2 + 2 * col
+
+    def index(self, row, col):
+        assert 1 <= row <= self.size and 1 <= col <= self.size, "cell " + str(row) + "_" + str(col) + " is off the board"
+        return (row - 1) * self.size + col - 1
+
+    def get_cell(self, row, col):
+        return self.cells[self.index(row, col)]
+
+    def set_cell(self, row, col, state):
+        self.set_index(self.index(row, col), state)
+
+    def set_index(self, index, state):
+        self.cells[index] = state
+        if self.text is not None:
+            self.text[self.text_offset(index)] = Board.cell_chars[state]
+        self.changes.append(index)
+        self.version += 1
+
+    # Place a ship on the given (row, col) cells
+    def place_ship(self, ship, coords):
+        indexes = [self.index(row, col) for row, col in coords]
+        ship_num = self.ship_nums.get(ship)
+        if ship_num is None:
+            ship_num = len(self.ship_names)
+            self.ship_nums[ship] = ship_num
+            self.ship_names.append(ship)
+            self.ship_cells.append(indexes)
+            self.remaining.append(len(indexes))
+        else:  # Moving a ship already placed
+            for index in self.ship_cells[ship_num]:
+                del self.ship_at[index]
+            self.ship_cells[ship_num] = indexes
+            self.remaining[ship_num] = len(indexes)
+        for index in indexes:
+            self.ship_at[index] = ship_num
+            self.set_index(index, Board.SHIP)
+
+    # Fire at a cell, a ship cell becomes HIT and any other cell becomes MISS, returns the new cell state
+    def shoot(self, row, col):
+        index = self.index(row, col)
+        cell = self.cells[index]
+        ship_num = self.ship_at.get(index, -1)
+        if cell == Board.SHIP:
+            state = Board.HIT
+            if ship_num >= 0:
+                self.remaining[ship_num] -= 1
+        else:
+            state = Board.MISS
+            if cell == Board.HIT and ship_num >= 0:  # A hit cell shot again no longer counts as hit
+                self.remaining[ship_num] += 1
+        self.set_index(index, state)
+        self.last_hit_ship = self.ship_names[ship_num] if state == Board.HIT and ship_num >= 0 else None
+        return state
+
+    def is_sunk(self, ship):
+        ship_num = self.ship_nums.get(ship)
+        return ship_num is not None and self.remaining[ship_num] == 0
+
+    def sink_ship(self, ship):
+        for index in self.ship_cells[self.ship_nums[ship]]:
+            self.set_index(index, Board.SUNK)
+
+    # Text grid, first row and column hold the axis labels
+    def get_grid(self):
+        if self.text is None:
+            self.text = Board.render_empty(self.size)
+            for index, state in enumerate(self.cells):
+                if state != Board.EMPTY:
+                    self.text[self.text_offset(index)] = Board.cell_chars[state]
+        return self.text.decode()
+
+    # Format of the delta entries of a board with this many cells
+    @staticmethod
+    def delta_format(cell_count):
+        return delta_entry if cell_count <= 65536 else wide_delta_entry
+
+    # Binary update bringing a copy of the board at version since up to date, a full board if since is None
+    def encode_update(self, since=None, hide_ships=False):
+        if since == self.version:
+            return update_header.pack(b'N', self.version)
+        if since is not None and 0 <= since < self.version:
+            changed = dict.fromkeys(self.changes[since:])  # Each changed cell once, in order
+            if hide_ships:  # Ship cells are empty to enemies, listing them at all would give the ships away
+                changed = [index for index in changed if self.cells[index] != Board.SHIP]
+            entry = Board.delta_format(len(self.cells))
+            if len(changed) * entry.size < len(self.cells):  # Only when smaller than the full board
+                entries = bytearray()
+                for index in changed:
+                    entries += entry.pack(index, self.cells[index])
+                return update_header.pack(b'D', self.version) + delta_count.pack(len(changed)) + entries
+        cells = self.cells.translate(Board.hide_ships_table) if hide_ships else self.cells
+        return update_header.pack(b'F', self.version) + full_size.pack(self.size) + cells
+
+    # Apply an update from encode_update to a copy of the board cells (None if there is no copy yet)
+    # Returns the new version and cells
+    @staticmethod
+    def apply_update(update, cells):
+        kind, version = update_header.unpack_from(update)
+        pos = update_header.size
+        if kind == b'F':
+            return version, bytearray(update[pos + full_size.size:])
+        elif kind == b'D':
+            cells = bytearray(cells)
+            for index, state in Board.delta_entries(update, len(cells)):
+                cells[index] = state
+        return version, cells
+
+    # (cell index, state) of every entry of a delta update for a board of cell_count cells
+    @staticmethod
+    def delta_entries(update, cell_count):
+        entry = Board.delta_format(cell_count)
+        pos = update_header.size
+        count = delta_count.unpack_from(update, pos)[0]
+        pos += delta_count.size
+        return [entry.unpack_from(update, pos + i * entry.size) for i in range(count)]
@@ -0,0 +1,239 @@
+# Bots - computer players that choose their shots from a probability density map of each enemy board
+# The density of a cell is the number of ways the enemy's afloat ships can still cover it, kept up to date
+# from every HIT, MISS and SUNK event instead of being recomputed for every shot
+# The maps hold every placement of every ship size, so bots are only allowed on boards up to max_board_size
+# where a bot's move stays well under a millisecond; each map starts as a copy of a blank map built once per
+# board size and fleet, so the first move against an enemy does not build it under the game lock
+import random
+from game import Game
+from player import Player
+from placements import PlacementIndex, random_fleet
+
+max_board_size = 20  # Largest board size bots play on (see the server's BOT_PLAYERS)
+blank_maps = {}  # key: (board size, fleet items), value: target map with nothing shot yet
+
+
+# What one player knows about one enemy board of a game's board size and fleet (dict of ship -> ship size)
+class TargetMap():
+    UNKNOWN = 0
+    HIT = 1  # Hit a ship that is still afloat
+    BLOCKED = 2  # Missed or part of a sunk ship, no afloat ship can cover it
+
+    def __init__(self, board_size=10, ship_size=None):
+        self.ship_size = ship_size or Game.ship_size
+        self.ship_sizes = sorted(set(self.ship_size.values()))
+        self.cell_count = board_size * board_size
+        # Cell indexes of every placement of each ship size, and the placements covering each cell
+        placement_index = PlacementIndex.get(board_size)
+        self.placements = {size: placement_index.cells(size) for size in self.ship_sizes}
+        self.covering = {size: placement_index.covering(size) for size in self.ship_sizes}
+        self.cells = bytearray(self.cell_count)
+        self.hits = set()  # Cells of HIT state
+        self.afloat = {size: 0 for size in self.ship_sizes}  # Afloat ships of each size
+        for ship in self.ship_size:
+            self.afloat[self.ship_size[ship]] += 1
+        self.valid = {size: bytearray(b'\x01' * len(self.placements[size])) for size in self.ship_sizes}
+        # Ways the afloat ships can cover each cell
+        self.density = [0] * self.cell_count
+        for size in self.ship_sizes:
+            for cells in self.placements[size]:
+                for cell in cells:
+                    self.density[cell] += self.afloat[size]
+
+    # Target map in the same state, sharing the placements that never change
+    def copy(self):
+        target_map = TargetMap.__new__(TargetMap)
+        target_map.__dict__.update(self.__dict__)
+        target_map.cells = bytearray(self.cells)
+        target_map.hits = set(self.hits)
+        target_map.afloat = dict(self.afloat)
+        target_map.valid = {size: bytearray(valid) for size, valid in self.valid.items()}
+        target_map.density = list(self.density)
+        return target_map
+
+    def hit(self, cell):
+        if self.cells[cell] == TargetMap.UNKNOWN:
+            self.cells[cell] = TargetMap.HIT
+            self.hits.add(cell)
+
+    def miss(self, cell):
+        if self.cells[cell] != TargetMap.BLOCKED:
+            self.block(cell)
+
+    def sunk(self, ship, ship_cells):
+        for cell in ship_cells:
+            self.block(cell)
+        size = self.ship_size[ship]
+        self.afloat[size] -= 1
+        valid = self.valid[size]
+        for p, cells in enumerate(self.placements[size]):  # One ship fewer of this size to cover the cells
+            if valid[p]:
+                for cell in cells:
+                    self.density[cell] -= 1
+
+    # No afloat ship can cover the cell anymore, remove the placements covering it from the density
+    # A hit cell shot again is a miss on the board, so it is no longer a hit to aim around either
+    def block(self, cell):
+        self.cells[cell] = TargetMap.BLOCKED
+        self.hits.discard(cell)
+        for size in self.ship_sizes:
+            valid = self.valid[size]
+            weight = self.afloat[size]
+            for p in self.covering[size][cell]:
+                if valid[p]:
+                    valid[p] = 0
+                    if weight:
+                        for covered in self.placements[size][p]:
+                            self.density[covered] -= weight
+
+    # Best cell to shoot, placements through the hits of damaged ships count far more than the others
+    def best_cell(self, rng=random):
+        if self.hits:
+            scores = {}
+            for size in self.ship_sizes:
+                weight = self.afloat[size]
+                if not weight:
+                    continue
+                valid = self.valid[size]
+                seen = set()
+                for hit in self.hits:
+                    for p in self.covering[size][hit]:
+                        if valid[p] and p not in seen:
+                            seen.add(p)
+                            cells = self.placements[size][p]
+                            hit_count = sum(1 for cell in cells if cell in self.hits)
+                            for cell in cells:
+                                if self.cells[cell] == TargetMap.UNKNOWN:
+                                    scores[cell] = scores.get(cell, 0) + weight * 100 ** hit_count
+            if scores:
+                return max_cell(scores.items(), rng)
+        cell = max_cell(((cell, self.density[cell]) for cell in range(self.cell_count)
+                         if self.cells[cell] == TargetMap.UNKNOWN), rng)
+        if cell is None:  # Nothing left unshot, shoot any cell not known to be empty or sunk
+            cells = [cell for cell in range(self.cell_count) if self.cells[cell] != TargetMap.BLOCKED]
+            cell = rng.choice(cells) if cells else rng.randrange(self.cell_count)
+        return cell
+
+
+# Target map of a board with nothing shot yet, a copy of the blank map of the board size and fleet
+def new_map(board_size=10, ship_size=None):
+    key = (board_size, tuple((ship_size or Game.ship_size).items()))
+    if key not in blank_maps:
+        blank_maps[key] = TargetMap(board_size, ship_size)
+    return blank_maps[key].copy()
+
+
+# Cell of highest score from (cell, score) pairs, ties are broken at random, None if there are no pairs
+def max_cell(cell_scores, rng):
+    best_cells = []
+    best_score = None
+    for cell, score in cell_scores:
+        if best_score is None or score > best_score:
+            best_cells = [cell]
+            best_score = score
+        elif score == best_score:
+            best_cells.append(cell)
+    return rng.choice(best_cells) if best_cells else None
+
+
+# Computer player, reads the game events like a client and picks its shots from the target maps
+class Bot():
+    def __init__(self, game, player_num, rng=random):
+        self.game = game
+        self.player_num = player_num
+        self.rng = rng
+        self.board_size = game.board_size
+        self.placement_index = PlacementIndex.get(game.board_size)
+        self.maps = {}  # key: enemy player num, value: target map of their board
+        self.event_cursor = 0  # Game events read so far
+        self.player_nums = {}  # key: username, value: player num
+
+    # Apply the game events since the last move to the target maps
+    def read_events(self):
+        events = self.game.events[self.event_cursor:]
+        self.event_cursor += len(events)
+        for event in events:
+            tokens = event.split()
+            if tokens[0] not in ("HIT", "MISS", "SUNK"):
+                continue
+            target_map = self.get_map(self.get_player_num(tokens[2]))
+            if tokens[0] == "SUNK":
+                target_map.sunk(tokens[3], [self.placement_index.coord_cell(coord) for coord in tokens[4:]])
+            else:
+                cell = (int(tokens[3]) - 1) * self.board_size + int(tokens[4]) - 1
+                if tokens[0] == "HIT":
+                    target_map.hit(cell)
+                else:
+                    target_map.miss(cell)
+
+    def get_player_num(self, username):
+        if username not in self.player_nums:
+            self.player_nums = {player.username: player_num for player_num, player in self.game.players.items()}
+        return self.player_nums[username]
+
+    def get_map(self, player_num):
+        if player_num not in self.maps:
+            self.maps[player_num] = new_map(self.board_size, self.game.ship_size)
+        return self.maps[player_num]
+
+    # Returns (defender num, row, col) of the bot's next shot
+    # Damaged enemies are finished off first, otherwise every bot keeps shooting the same enemy until it is out
+    def choose_move(self, attacker=None):
+        self.read_events()
+        attacker = attacker or self.game.players[self.player_num]
+        enemies = [player_num for player_num, player in self.game.players.items()
+                   if player.team != attacker.team and player.is_alive]
+        defender_num = enemies[0]
+        for player_num in enemies:
+            if self.get_map(player_num).hits:
+                defender_num = player_num
+                break
+        cell = self.get_map(defender_num).best_cell(self.rng)
+        return defender_num, cell // self.board_size + 1, cell % self.board_size + 1
+
+
+# Shooter for simulation.play_game where every player is a bot
+class BotShooter():
+    def __init__(self, game, rng=random):
+        self.bots = {player_num: Bot(game, player_num, rng) for player_num in game.players}
+
+    def choose_move(self, attacker):
+        return self.bots[attacker.player_num].choose_move(attacker)
+
+
+# Add bot players to a game once its human players have joined, called with the game lock held
+# Each bot joins the team with the fewest players, preferring teams no one has picked so the game can start
+def add_bots(game, bot_count, rng=random):
+    for i in range(bot_count):
+        team = min(Game.team_colors, key=lambda color: len(game.teams.get(color, [])))
+        player_num = game.assign_player_num()
+        game.add_player(Player("Bot-" + str(player_num), team, player_num, game.board_size, game.ships), player_num)
+        game.add_team(team, player_num)
+        game.bots[player_num] = Bot(game, player_num, rng)
+        game.player_joined()
+    for player_num in game.bots:
+        fleet = random_fleet(rng, game.board_size, game.ship_size)
+        player = game.players[player_num]
+        with player.board_lock:
+            for ship in fleet:
+                player.set_ship_coordinates(ship, fleet[ship])
+        game.player_ready()
+
+
+# Play the moves of every bot whose team has the turn, until it is a human's turn or the game is over
+# Called with the game lock held, returns the moves made as (bot player num, defender num, row, col)
+def play_bot_moves(game):
+    moves = []
+    while game.bots and game.game_start and not game.game_end:  # Games without bots skip the team scan
+        team = [game.players[player_num] for player_num in game.teams[game.team_turn]]
+        movers = [player for player in team if player.is_alive and not game.has_taken_turn(player)]
+        bot_movers = [player for player in movers if player.player_num in game.bots]
+        if not bot_movers:
+            break
+        for player in bot_movers:
+            defender_num, row, col = game.bots[player.player_num].choose_move(player)
+            game.make_move(player, game.players[defender_num], row, col)
+            moves.append((player.player_num, defender_num, row, col))
+            if game.game_end or game.team_turn != player.team:
+                break
+    return moves
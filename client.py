@@ -4,8 +4,13 @@ import sys
 import os
 import configparser
 import json
+import threading
+import queue
+import protocol
+from logger import ActionLogger
 from game import Game
-from player import Player
+from board import Board
+from placements import PlacementIndex
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
@@ -13,15 +18,19 @@ from tkinter import messagebox
 # Global variables
 hostname = None
 server_port = None
-chat_port_min = None
+push_port = None
+push_updates = False  # Have the server push game events instead of polling for them
 configfile = 'client\conf\client.cfg'
 configs = None
 logfile = ""
-recv_buffer = None
+log_level = None  # Lowest level written to the log, DEBUG also logs every update received
+log_flush_interval = None  # Seconds logged records may wait before the log file is flushed
+action_logger = None  # Writes print_action records from a background thread
 
 username = None
 team = None
 player_num = None
+room_id = ""  # Room to join, empty to join any room waiting for players
 
 # GUI variables
 TITLE_FONT = ("Helvetica", 18)
@@ -29,16 +38,37 @@ BODY_FONT = ("Helvetica", 12)
 frame_size = {"small": "550x150", "medium": "600x520", "large": "1080x750"}
 
 connection_socket = None  # TCP connection for request commands to server
+push_socket = None  # TCP connection the server pushes game events on
+push_queue = queue.Queue()  # Pushed (kind, message) pairs waiting to be displayed
+
+# Board size and fleet (dict of ship -> ship size, in the order ships are placed) of the game,
+# sent by the server with the JOIN reply that starts the setup phase
+board_size = 10
+fleet = dict(Game.ship_size)
+ship_colors = dict(Game.ship_color)  # key: ship, value: color the ship is drawn in
+extra_ship_colors = ["orange", "pink", "brown", "olive", "navy", "maroon", "turquoise"]  # For ships of other fleets
+team_text_colors = {}  # key: team, value: color the team is shown in
+team_palette = ["red", "blue", "green", "purple", "dark orange", "brown", "teal", "magenta", "navy", "olive",
+                "maroon", "dark cyan"]  # For teams not named after a color
 
 # Keeps track of selected coordinates
-ship_coords = { "carrier": [], "battleship": [], "cruiser": [], "submarine": [], "destroyer": []}
-coords_taken = []
+ship_coords = {ship: [] for ship in fleet}
+coords_taken = 0  # Bitmask of the cells taken by ships, bit N is cell index N of the placement index
+placement_index = PlacementIndex.get(board_size)  # Every legal placement of each ship size
 coords_complete = False
 
 game_state = None
 game_end = False
+game_event_count = 0  # Game state messages received so far, the server sends the ones after it
 # Keeps track of players by username
 players = {}
+# Boards already received, key: player num, value: (board version, board cells)
+board_cache = {}
+ally_ship_coords = {}  # key: player num of an ally, value: ship coords dict
+# Color of each cell state on a board view, None for cells left empty
+board_colors = {Board.EMPTY: None, Board.SHIP: None,
+                Board.HIT: Game.move_markers["HIT"], Board.MISS: Game.move_markers["MISS"],
+                Board.SUNK: Game.move_markers["SUNK"]}
 
 
 # Root GUI Window
@@ -97,16 +127,13 @@ class BattleshipApp(tk.Tk):
 # Messages to be displayed when selected from the menu
 def menu_rules():
     rules = '''Battleship Rules:
-    \nEach player is part of a team, and has their own 10 x 10 board where they place 5 ships horizontally or Vertically:
-    Carrier (length of 5)
-    Battleship (length of 4)
-    Cruiser (length of 3)
-    Submarine (length of 5)
-    Destroyer (length of 2)
+    \nEach player is part of a team, and has their own ''' + str(board_size) + ' x ' + str(board_size) + \
+    ' board where they place ' + str(len(fleet)) + ' ships horizontally or Vertically:\n    ' + \
+    '\n    '.join(ship.capitalize() + ' (length of ' + str(fleet[ship]) + ')' for ship in fleet) + '''
     \nEach team takes their turn once each game turn, for each player in a team, they get to shoot once per game turn.
     \nIf a shot hits, a HIT is displayed, otherwise a MISS is displayed.
     \nIf a shot hits a ship and all cells of the ship have been hit, The ship has been sunk and the type of ship sunk is displayed.
-    \nIf all 5 ships of a player has been sunk, then that player is eliminated, if all players of a team have been eliminated, the team is also eliminated.
+    \nIf all ships of a player have been sunk, then that player is eliminated, if all players of a team have been eliminated, the team is also eliminated.
     \nThe game ends when only one team remains (not eliminated), they are the winners of the Battleship Game.'''
     messagebox.showinfo("Rules", rules)
 
@@ -115,10 +142,10 @@ def menu_setup():
     setup_msg = '''Joining a game:
     \nEnter a username and select a team color, afterwards wait for enough players to join in order to go to setup phase.
     \nGame Setup:
-    \nYou are prompted to select the coordinates for your 5 ships. First, you select a coordinate that will represent the first endpoint of the ship.
+    \nYou are prompted to select the coordinates for each of your ships. First, you select a coordinate that will represent the first endpoint of the ship.
     \nThen, you must select a coordinate that is N spaces away horizontally or vertically, where N is the length of the ship.
     \nShips cannot overlap previously taken coordinates that are reserved for other ships.
-    \nOnce you select coordinates for all 5 ships, press the DONE button, and wait for all players to complete their board setup.'''
+    \nOnce you select coordinates for all ships, press the DONE button, and wait for all players to complete their board setup.'''
     messagebox.showinfo("Setup", setup_msg)
 
 
@@ -185,7 +212,7 @@ class ConnectFrame(tk.Frame):
 
 # Setup TCP connection with the server
 def connect_server(controller):
-    global connection_socket, player_num
+    global connection_socket
 
     # Establish Control Connection (TCP)
     try:
@@ -194,7 +221,7 @@ def connect_server(controller):
         connection_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
         connection_socket.connect((hostname, server_port))
 
-        conn_msg = connection_socket.recv(recv_buffer).decode()
+        conn_msg = protocol.recv_message(connection_socket)
         conn_tokens = conn_msg.split()
         print_action('\tServer Response:\n\t' + conn_msg)
 
@@ -202,11 +229,9 @@ def connect_server(controller):
         if conn_tokens[0] != 'SRDY':
             print_action('\nEnding Battleship Client Session')
             app.destroy()  # Forcibly close window
-        else:
-            player_num = int(conn_tokens[1])
     except (OSError, Exception) as e:
         connection_socket.close()
-        print_action('Socket or Tkinter error: ' + str(e))
+        print_action('Socket or Tkinter error: ' + str(e), "ERROR")
         app.destroy()  # Forcibly close window
 
     controller.show_frame("Select")
@@ -231,20 +256,10 @@ class SelectFrame(tk.Frame):
         self.team_label = tk.Label(self, text="Select Team:", font=BODY_FONT)
         self.team_label.grid(row=2, column=1, sticky='W', padx=20, pady=10)
 
-        self.radioButtonFrame = tk.Frame(self)
-        self.radioButtonFrame.grid(row=2, column=2, sticky='W', padx=20, pady=10)
-        self.team_red_rbutton = tk.Radiobutton(self.radioButtonFrame, text="Red", fg="red", font=BODY_FONT,
-                                               variable=self.team_color, value="Red")
-        self.team_red_rbutton.grid(row=1, column=1)
-        self.team_blue_rbutton = tk.Radiobutton(self.radioButtonFrame, text="Blue", fg="blue", font=BODY_FONT,
-                                                variable=self.team_color, value="Blue")
-        self.team_blue_rbutton.grid(row=1, column=2)
-        self.team_green_rbutton = tk.Radiobutton(self.radioButtonFrame, text="Green", fg="green", font=BODY_FONT,
-                                                 variable=self.team_color, value="Green")
-        self.team_green_rbutton.grid(row=1, column=3)
-        self.team_purple_rbutton = tk.Radiobutton(self.radioButtonFrame, text="Purple", fg="purple", font=BODY_FONT,
-                                                  variable=self.team_color, value="Purple")
-        self.team_purple_rbutton.grid(row=1, column=4)
+        # Pick one of the team colors or type any other team name
+        self.team_combobox = ttk.Combobox(self, width=32, textvariable=self.team_color, font=BODY_FONT,
+                                          values=tuple(Game.team_colors))
+        self.team_combobox.grid(row=2, column=2, sticky='W', padx=20, pady=10)
 
         self.select_msg_label = tk.Label(self, textvariable=self.connect_msg, width=25, font=BODY_FONT)
         self.select_msg_label.grid(row=3, column=1, sticky='W', padx=5, pady=10)
@@ -261,10 +276,13 @@ def send_user_and_team(controller, user, team_color):
     # Send over Username and Team Color
     if user == "":
         select_frame.connect_msg.set("Error: Missing username")
-        print_action("Error: Missing username")
+        print_action("Error: Missing username", "ERROR")
     elif team_color == "":
         select_frame.connect_msg.set("Error: Have not selected a team")
-        print_action("Error: Have not selected a team")
+        print_action("Error: Have not selected a team", "ERROR")
+    elif len(team_color.split()) > 1:
+        select_frame.connect_msg.set("Error: Team name has spaces")
+        print_action("Error: Team name has spaces", "ERROR")
     else:
         username = user
         team = team_color
@@ -277,21 +295,130 @@ def send_user_and_team(controller, user, team_color):
 
 # Wait for all players to join
 def wait_for_join_rdy(controller, user, team_color):
-    connection_socket.send(("JOIN " + user + " " + team_color).encode())
-    msg = connection_socket.recv(recv_buffer).decode()
+    global player_num, room_id
+    protocol.send_message(connection_socket, "JOIN " + user + " " + team_color + " " + room_id)
+    # The OK reply carries the board size and fleet of the game on its second line
+    join_msg, _, rules = protocol.recv_message(connection_socket).partition('\n')
+    msg_tokens = join_msg.split()
+    if msg_tokens and msg_tokens[0] in ("OK", "WAIT"):
+        # Server replies with the player num and room assigned to this player
+        player_num = int(msg_tokens[1])
+        room_id = msg_tokens[2]
     # All players have joined, go to game setup
-    if msg == "OK":
-        print_action("All Players have Joined, Go to Setup")
+    if msg_tokens and msg_tokens[0] == "OK":
+        print_action("All Players have Joined room " + room_id + ", Go to Setup")
+        set_rules(json.loads(rules))
+        controller.frames["Setup"].start_setup()
         app.geometry(frame_size["medium"])  # Resize and show setup frame
         controller.show_frame("Setup")
-    elif msg == "WAIT":  # Send another request to server after 100ms
+    elif msg_tokens and msg_tokens[0] == "WAIT":  # Send another request to server after 100ms
         app.after(100, wait_for_join_rdy, controller, user, team_color)
+    elif msg_tokens and msg_tokens[0] == "BUSY":
+        print_action("Error: " + ' '.join(msg_tokens[1:]), "ERROR")
+        connection_socket.close()
+        app.destroy()  # Forcibly close window
     else:  # Error in team setup
-        print_action("Error: Team Setup Failure")
+        print_action("Error: Team Setup Failure", "ERROR")
         connection_socket.close()
         app.destroy()  # Forcibly close window
 
 
+# Use the board size and fleet of the game sent with the JOIN reply
+def set_rules(rules):
+    global board_size, fleet, placement_index, ship_coords, ship_colors
+    board_size = rules["board_size"]
+    fleet = rules["fleet"]
+    placement_index = PlacementIndex.get(board_size)
+    ship_coords = {ship: [] for ship in fleet}
+    ship_colors = {ship: Game.ship_color.get(ship, extra_ship_colors[i % len(extra_ship_colors)])
+                   for i, ship in enumerate(fleet)}
+    print_action("Board size " + str(board_size) + ", fleet " + str(fleet))
+
+
+# Board drawn on a canvas instead of a widget per cell, only cells that are not empty get a canvas item
+# so even large boards draw quickly; boards too large for the window scroll
+class BoardView(tk.Frame):
+    view_pixels = 330  # Largest width and height of the visible part of the cells
+    max_cell_pixels = 30
+    min_cell_pixels = 5  # Cells are never drawn smaller than this, larger boards scroll instead
+
+    # command is called with (row, col) of every clicked cell
+    def __init__(self, parent, command=None):
+        tk.Frame.__init__(self, parent)
+        self.command = command
+        self.size = 0
+        self.cell_pixels = BoardView.max_cell_pixels
+        self.margin = 0  # Room for the axis labels left of and above the cells
+        self.items = {}  # key: cell index, value: canvas rectangle of a cell that is not empty
+        self.canvas = tk.Canvas(self, width=BoardView.view_pixels, height=BoardView.view_pixels,
+                                highlightthickness=0)
+        self.canvas.grid(row=0, column=0)
+        self.canvas.bind("<Button-1>", self.click)
+        self.y_scrollbar = tk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.x_scrollbar = tk.Scrollbar(self, orient="horizontal", command=self.canvas.xview)
+        self.canvas.configure(xscrollcommand=self.x_scrollbar.set, yscrollcommand=self.y_scrollbar.set)
+
+    # Draw an empty board of the given size with its grid lines and axis labels
+    def draw(self, size):
+        self.canvas.delete("all")
+        self.items = {}
+        self.size = size
+        cell = max(BoardView.min_cell_pixels, min(BoardView.max_cell_pixels, BoardView.view_pixels // size))
+        self.cell_pixels = cell
+        self.margin = max(24, 10 + 9 * len(Board.row_label(size)))
+        end = self.margin + size * cell
+        self.canvas.configure(width=min(end, self.margin + BoardView.view_pixels),
+                              height=min(end, self.margin + BoardView.view_pixels), scrollregion=(0, 0, end, end))
+        if end > self.margin + BoardView.view_pixels:
+            self.y_scrollbar.grid(row=0, column=1, sticky='NS')
+            self.x_scrollbar.grid(row=1, column=0, sticky='WE')
+        else:
+            self.y_scrollbar.grid_remove()
+            self.x_scrollbar.grid_remove()
+
+        self.canvas.create_rectangle(self.margin, self.margin, end, end, outline="gray")
+        if cell >= 8:  # Grid lines, smaller cells would be all lines
+            for i in range(1, size):
+                self.canvas.create_line(self.margin + i * cell, self.margin, self.margin + i * cell, end, fill="gray")
+                self.canvas.create_line(self.margin, self.margin + i * cell, end, self.margin + i * cell, fill="gray")
+        step = -(-(10 * len(str(size)) + 8) // cell)  # Cells between axis labels, so the widest labels fit
+        for i in range(1 if step == 1 else step, size + 1, step):
+            middle = self.margin + (i - 1) * cell + cell // 2
+            self.canvas.create_text(middle, self.margin // 2, text=str(i), font=BODY_FONT)
+            self.canvas.create_text(self.margin // 2, middle, text=Board.row_label(i), font=BODY_FONT)
+
+    # Color a cell, None clears it
+    def set_cell(self, row, col, color=None):
+        index = (row - 1) * self.size + col - 1
+        item = self.items.get(index)
+        if color is None:
+            if item is not None:
+                self.canvas.delete(item)
+                del self.items[index]
+        elif item is None:
+            x = self.margin + (col - 1) * self.cell_pixels
+            y = self.margin + (row - 1) * self.cell_pixels
+            self.items[index] = self.canvas.create_rectangle(x, y, x + self.cell_pixels, y + self.cell_pixels,
+                                                             fill=color, outline="gray" if self.cell_pixels >= 8 else "")
+        else:
+            self.canvas.itemconfigure(item, fill=color)
+
+    # Show board cells (one cell state per byte, see Board) in place of every cell shown now
+    def show_cells(self, cells):
+        for item in self.items.values():
+            self.canvas.delete(item)
+        self.items = {}
+        for index, state in enumerate(cells):
+            if board_colors[state] is not None:
+                self.set_cell(index // self.size + 1, index % self.size + 1, board_colors[state])
+
+    def click(self, event):
+        x = int(self.canvas.canvasx(event.x)) - self.margin
+        y = int(self.canvas.canvasy(event.y)) - self.margin
+        if self.command is not None and 0 <= x < self.size * self.cell_pixels and 0 <= y < self.size * self.cell_pixels:
+            self.command(y // self.cell_pixels + 1, x // self.cell_pixels + 1)
+
+
 # Third Frame, Asks user to place down their ships on their board
 class SetupFrame(tk.Frame):
     def __init__(self, parent, controller):
@@ -300,38 +427,20 @@ class SetupFrame(tk.Frame):
 
         # Prompt User for ship coordinates
         self.select_msg = tk.StringVar()
-        self.select_msg.set("Select first end coordinate for the carrier (length of 5)")
         self.select_input = tk.StringVar()
         self.select_input.set("Input: ")
         self.error_msg = tk.StringVar()
 
         self.current_ship = tk.StringVar()
-        self.current_ship.set(Game.ships[0])
         self.select_first = tk.BooleanVar()  # Keeps track of selecting first end point or second end point
         self.select_first.set(True)
 
         self.setup_label = tk.Label(self, text="Select your Ship Positions", font=TITLE_FONT)
         self.setup_label.grid(row=1, column=1, padx=20, pady=10)
 
-        self.select_grid_frame = tk.Frame(self)
-        self.select_grid_frame.grid(row=2, column=1, padx=20, pady=10)
-
-        self.buttons = []  # Store buttons in 2D list
-        for row in range(11):
-            if row > 0:
-                self.buttons.append([])
-            for col in range(11):
-                if row == 0 and col == 0:
-                    tk.Label(self.select_grid_frame, text="", font=BODY_FONT).grid(row=row, column=col)
-                elif row == 0 and col in range(1, 11):
-                    tk.Label(self.select_grid_frame, text=str(col), font=BODY_FONT).grid(row=row, column=col)
-                elif row in range(1, 11) and col == 0:
-                    tk.Label(self.select_grid_frame, text=Game.rows[row], font=BODY_FONT).grid(row=row, column=col)
-                else:
-                    button = tk.Button(self.select_grid_frame, text=(Game.rows[row] + str(col)), height=1, width=3)
-                    button.grid(row=row, column=col)
-                    button.configure(command=lambda row=row, col=col: press_coord(controller, row, col, self.current_ship))
-                    self.buttons[row-1].append(button)
+        self.board_view = BoardView(self, command=lambda row, col: press_coord(controller, row, col,
+                                                                               self.current_ship))
+        self.board_view.grid(row=2, column=1, padx=20, pady=10)
 
         self.display_frame = tk.Frame(self, borderwidth=4, relief="raised")
         self.display_frame.grid(row=3, column=1, padx=20, pady=10)
@@ -344,6 +453,16 @@ class SetupFrame(tk.Frame):
         self.setup_button = tk.Button(self.display_frame, text="", width=10, bg="dark gray")
         self.setup_button.grid(row=2, column=2, padx=20, pady=5)
 
+    # Draw the board and ask for the first ship, once the board size and fleet of the game are known
+    def start_setup(self):
+        self.board_view.draw(board_size)
+        self.current_ship.set(list(fleet)[0])
+        self.select_msg.set(ship_prompt(self.current_ship.get()))
+
+
+def ship_prompt(ship):
+    return "Select first end coordinate for the " + ship + " (length of " + str(fleet[ship]) + ") "
+
 
 def press_coord(controller, row, col, ship):
     global ship_coords, coords_taken, coords_complete
@@ -351,110 +470,73 @@ def press_coord(controller, row, col, ship):
         setup_frame = controller.frames["Setup"]
 
         c_format = str(row) + "_" + str(col)
-        coord = Game.rows[row] + str(col)
-        if c_format in coords_taken:  # User selected a coordinate already occupied by a previous ship
+        coord = Board.row_label(row) + str(col)
+        if coords_taken >> placement_index.coord_cell(c_format) & 1:  # User selected a coordinate already occupied by a previous ship
             setup_frame.error_msg.set("Error: " + coord + " is already occupied")
         else:
             setup_frame.error_msg.set("")
             if setup_frame.select_first.get():  # Notify user of first button press for given ship
                 ship_coords[ship.get()].append(c_format)
-                setup_frame.select_msg.set("Select first end coordinate for the " + ship.get() +
-                                           " (length of " + str(Game.ship_size[ship.get()]) + ") ")
-                coords_taken.append(c_format)
+                setup_frame.select_msg.set(ship_prompt(ship.get()))
+                coords_taken |= 1 << placement_index.coord_cell(c_format)
                 setup_frame.select_first.set(False)
 
-                setup_frame.buttons[row - 1][col - 1].configure(bg=Game.ship_color[ship.get()])
+                setup_frame.board_view.set_cell(row, col, ship_colors[ship.get()])
             else:  # Second button pressed for given ship, confirm its a valid set of coordinates
                 first_coord = ship_coords[ship.get()][0]
                 gen_coords = generate_coords(ship, first_coord, c_format)
                 if gen_coords:  # Store input coordinates for this ship, request for coordinates for next ship
                     for c in gen_coords:
                         ship_coords[ship.get()].append(c)
-                        coords_taken.append(c)
+                        coords_taken |= 1 << placement_index.coord_cell(c)
                         c_tokens = c.split('_')
-                        setup_frame.buttons[int(c_tokens[0])-1][int(c_tokens[1])-1].configure(
-                            bg=Game.ship_color[ship.get()])
+                        setup_frame.board_view.set_cell(int(c_tokens[0]), int(c_tokens[1]), ship_colors[ship.get()])
 
-                    ship_index = Game.ships.index(ship.get())
-                    if ship_index == len(Game.ships)-1:  # Got index of last ship, request user press DONE button
+                    ships = list(fleet)
+                    ship_index = ships.index(ship.get())
+                    if ship_index == len(ships)-1:  # Got index of last ship, request user press DONE button
                         coords_complete = True  # Block user from entering anymore coordinates
                         setup_frame.select_msg.set("You have entered all ship coordinates, press DONE button")
                         # Change features of Done button to make it usable
                         setup_frame.setup_button.configure(text="DONE", bg="Light Gray",
                                                            command=lambda: send_ship_coords(controller))
                     else:
-                        ship.set(Game.ships[ship_index+1])  # Update ship variable
+                        ship.set(ships[ship_index+1])  # Update ship variable
                         setup_frame.select_first.set(True)
-                        setup_frame.select_msg.set("Select first end coordinate for the " + ship.get() +
-                                       " (length of " + str(Game.ship_size[ship.get()]) + ") ")
+                        setup_frame.select_msg.set(ship_prompt(ship.get()))
 
                 else:  # Reset input coordinates for this ship
                     setup_frame.error_msg.set("Error: Invalid second endpoint for ship")
                     setup_frame.select_first.set(True)
-                    setup_frame.select_msg.set("Select first end coordinate for the " + ship.get() +
-                                   " (length of " + str(Game.ship_size[ship.get()]) + ") ")
+                    setup_frame.select_msg.set(ship_prompt(ship.get()))
                     # Clear saved coordinate for given ship
                     f_c_tokens = first_coord.split('_')
-                    setup_frame.buttons[int(f_c_tokens[0]) - 1][int(f_c_tokens[1]) - 1].configure(bg="SystemButtonFace")
-                    coords_taken.remove(first_coord)
+                    setup_frame.board_view.set_cell(int(f_c_tokens[0]), int(f_c_tokens[1]))
+                    coords_taken &= ~(1 << placement_index.coord_cell(first_coord))
                     ship_coords[ship.get()] = []
 
 
-# Generate the coordinates of a ship, return empty list if the input is invalid
+# Generate the coordinates of a ship besides its first end, return empty list if the input is invalid
 def generate_coords(ship, start_coord, end_coord):
-    coords = []
-    start = start_coord.split('_')
-    end = end_coord.split('_')
-    s_row = int(start[0])
-    s_col = int(start[1])
-    e_row = int(end[0])
-    e_col = int(end[1])
-
-    if s_row == e_row and abs(s_col - e_col) == Game.ship_size[ship.get()] - 1:  # Same row and right length
-        if s_col < e_col:
-            for y in range(s_col + 1, e_col + 1):
-                new_coord = str(s_row) + '_' + str(y)
-                if new_coord not in coords_taken:
-                    coords.append(new_coord)
-                else:
-                    return []
-        else:
-            for y in range(e_col, s_col):
-                new_coord = str(s_row) + '_' + str(y)
-                if new_coord not in coords_taken:
-                    coords.append(new_coord)
-                else:
-                    return []
-    elif s_col == e_col and abs(s_row - e_row) == Game.ship_size[ship.get()] - 1:  # Same col and right length
-        if s_row < e_row:
-            for x in range(s_row + 1, e_row + 1):
-                new_coord = str(x) + '_' + str(s_col)
-                if new_coord not in coords_taken:
-                    coords.append(new_coord)
-                else:
-                    return []
-        else:
-            for x in range(e_row, s_row):
-                new_coord = str(x) + '_' + str(s_col)
-                if new_coord not in coords_taken:
-                    coords.append(new_coord)
-                else:
-                    return []
-    else:  # Invalid coordinate endpoints or invalid length given
+    size = fleet[ship.get()]
+    start = placement_index.coord_cell(start_coord)
+    placement = placement_index.find(size, start, placement_index.coord_cell(end_coord))
+    # Invalid endpoints or length, or the ship overlaps a previous ship (its first end is already taken by itself)
+    if placement is None or placement_index.mask(size, placement) & coords_taken & ~(1 << start):
         return []
-    return coords
+    return [coord for coord in placement_index.coords(size, placement) if coord != start_coord]
 
 
 def send_ship_coords(controller):
     print_action("User selected: " + str(ship_coords) + "\nSending coordinates to server")
-    # Send over coordinates
-    for ship in ship_coords:
-        connection_socket.send((ship + " " + " ".join(ship_coords[ship])).encode())
-        ok_msg = connection_socket.recv(recv_buffer).decode()
-        if ok_msg != "OK":
-            print_action("Error sending coords")
-            connection_socket.close()
-            app.destroy()
+    # Send over the whole fleet in one request, one line per ship
+    protocol.send_message(connection_socket, "FLEET\n" + "\n".join(ship + " " + " ".join(ship_coords[ship])
+                                                                    for ship in ship_coords))
+    ok_msg = protocol.recv_message(connection_socket)
+    if ok_msg != "OK":  # The server rejected the fleet: ERROR and the reason
+        print_action("Error sending coords: " + ok_msg, "ERROR")
+        connection_socket.close()
+        app.destroy()
 
     setup_frame = controller.frames['Setup']
     setup_frame.select_msg.set('Coordinates saved\nWaiting for other players to choose ship locations')
@@ -464,8 +546,8 @@ def send_ship_coords(controller):
 
 # Wait for all players to complete setup phase
 def wait_for_setup_rdy(controller):
-    connection_socket.send(("SETUP").encode())
-    msg = connection_socket.recv(recv_buffer).decode()
+    protocol.send_message(connection_socket, "SETUP")
+    msg = protocol.recv_message(connection_socket)
     # All players have finished selecting coordinates, go to game setup
     if msg == "OK":
         print_action("All Players have Setup, Go to Game Start")
@@ -476,7 +558,7 @@ def wait_for_setup_rdy(controller):
     elif msg == "WAIT":  # Send another request to server after 100ms
         app.after(100, wait_for_setup_rdy, controller)
     else:  # Error in team setup
-        print_action("Error: Player Setup Failure")
+        print_action("Error: Player Setup Failure", "ERROR")
         connection_socket.close()
         app.destroy()  # Forcibly close window
 
@@ -485,37 +567,59 @@ def wait_for_setup_rdy(controller):
 def receive_game_state(controller):
     global game_state
 
-    connection_socket.send("SEND INFO".encode())
+    protocol.send_message(connection_socket, "SEND INFO")
 
     print_action("Retrieving game state")
-    json_string = connection_socket.recv(recv_buffer).decode()
+    json_string = protocol.recv_message(connection_socket)
     game_state = json.loads(json_string)  # Convert json string to game state dict
 
     print_action("Game state: " + str(game_state))
     print_action("Transfer Success")
 
 
+# Color a team is shown in, a team named after a color is shown in it, other teams in the next palette color
+def team_color(name):
+    if name not in team_text_colors:
+        try:
+            app.winfo_rgb(name)
+            color = name
+        except tk.TclError:
+            color = team_palette[len(team_text_colors) % len(team_palette)]
+        team_text_colors[name] = color
+    return team_text_colors[name]
+
+
+# Text tags of every team of the game, status lines are tagged with the team name, chat lines with team-<team>
+def set_team_tags(game_frame):
+    for t in game_state['teams']:
+        game_frame.status_text.tag_configure(t, foreground=team_color(t))
+        game_frame.chat_text.tag_configure('team-' + t, foreground=team_color(t))
+
+
 # Setup the Game GUI to display initial data
 def init_game(controller):
-    global players
+    global players, push_updates
     game_frame = controller.frames["Game"]
 
     other_board_setup = False
     other_players = []
+    game_frame.your_board.draw(board_size)
+    game_frame.other_board.draw(board_size)
+    set_team_tags(game_frame)
     for p_num in game_state["players"]:
         p_user, p_team = game_state[str(p_num)]
         players[p_user] = (p_num, p_team)  # Store players by username
 
         if p_user == username:  # Setup Player's board
-            game_frame.your_label.configure(fg=p_team)
+            game_frame.your_label.configure(fg=team_color(p_team))
             for ship in ship_coords:
                 for coord in ship_coords[ship]:
                     coord_tokens = coord.split('_')
-                    game_frame.your_buttons[int(coord_tokens[0])-1][int(coord_tokens[1])-1].configure(bg=Game.ship_color[ship])
+                    game_frame.your_board.set_cell(int(coord_tokens[0]), int(coord_tokens[1]), ship_colors[ship])
         else:
             other_players.append(p_user + " (" + p_team + ")")
             if not other_board_setup:
-                game_frame.other_label.configure(text=(p_user + "'s Board"), fg=p_team)
+                game_frame.other_label.configure(text=(p_user + "'s Board"), fg=team_color(p_team))
                 other_board_setup = True
     game_frame.board_combobox['values'] = tuple(other_players)  # Setup other player board combobox
     game_frame.board_combobox.current(0)
@@ -532,7 +636,10 @@ def init_game(controller):
     if game_state["first_turn"] == team:
         game_frame.status_text.insert(tk.END, "Waiting for your move\n", team)
 
-    app.after(50, update_gui, controller)  # Begin constantly polling server for updates
+    if push_updates and not subscribe_updates():
+        print_action("Push updates unavailable, polling server instead")
+        push_updates = False
+    app.after(50, update_gui, controller)  # Begin constantly checking for updates
 
 
 # Fourth Frame, main game interface
@@ -549,47 +656,14 @@ class GameFrame(tk.Frame):
         self.your_label = tk.Label(self, text="Your Board", font=TITLE_FONT)
         self.your_label.grid(row=1, column=1, padx=20, pady=10)
 
-        self.your_grid_frame = tk.Frame(self)
-        self.your_grid_frame.grid(row=2, column=1, padx=20, pady=10)
-
-        self.your_buttons = []  # Store buttons in 2D list
-        for row in range(11):
-            if row > 0:
-                self.your_buttons.append([])
-            for col in range(11):
-                if row == 0 and col == 0:
-                    tk.Label(self.your_grid_frame, text="", font=BODY_FONT).grid(row=row, column=col)
-                elif row == 0 and col in range(1, 11):
-                    tk.Label(self.your_grid_frame, text=str(col), font=BODY_FONT).grid(row=row, column=col)
-                elif row in range(1, 11) and col == 0:
-                    tk.Label(self.your_grid_frame, text=Game.rows[row], font=BODY_FONT).grid(row=row, column=col)
-                else:
-                    button = tk.Button(self.your_grid_frame, text="", height=1, width=3)
-                    button.grid(row=row, column=col)
-                    self.your_buttons[row - 1].append(button)
+        self.your_board = BoardView(self)
+        self.your_board.grid(row=2, column=1, padx=20, pady=10)
 
         self.other_label = tk.Label(self, text="Other Board", font=TITLE_FONT)
         self.other_label.grid(row=1, column=2, padx=20, pady=10)
 
-        self.other_grid_frame = tk.Frame(self)
-        self.other_grid_frame.grid(row=2, column=2, padx=20, pady=10)
-
-        self.other_buttons = []  # Store buttons in 2D list
-        for row in range(11):
-            if row > 0:
-                self.other_buttons.append([])
-            for col in range(11):
-                if row == 0 and col == 0:
-                    tk.Label(self.other_grid_frame, text="", font=BODY_FONT).grid(row=row, column=col)
-                elif row == 0 and col in range(1, 11):
-                    tk.Label(self.other_grid_frame, text=str(col), font=BODY_FONT).grid(row=row, column=col)
-                elif row in range(1, 11) and col == 0:
-                    tk.Label(self.other_grid_frame, text=Game.rows[row], font=BODY_FONT).grid(row=row, column=col)
-                else:
-                    button = tk.Button(self.other_grid_frame, text="", height=1, width=3,
-                                       command=lambda row=row, col=col: make_move(controller, row, col))
-                    button.grid(row=row, column=col)
-                    self.other_buttons[row - 1].append(button)
+        self.other_board = BoardView(self, command=lambda row, col: make_move(controller, row, col))
+        self.other_board.grid(row=2, column=2, padx=20, pady=10)
 
         self.change_board_frame = tk.Frame(self)  # Change what other board displays
         self.change_board_frame.grid(row=3, column=2, sticky='WE', padx=20, pady=5)
@@ -610,11 +684,7 @@ class GameFrame(tk.Frame):
 
         self.status_text = tk.Text(self.status_frame, height=12, width=50, font=BODY_FONT)
         self.status_text.bind("<Key>", lambda e: "break")  # Set as read-only for user
-        # Set chat text options
-        self.status_text.tag_configure("Red", foreground="red")
-        self.status_text.tag_configure("Blue", foreground="blue")
-        self.status_text.tag_configure("Green", foreground="green")
-        self.status_text.tag_configure("Purple", foreground="purple")
+        # Team text colors are set once the teams are known, see set_team_tags
         self.status_text.grid(row=2, column=1, sticky='E', padx=5, pady=5)
         self.status_scrollbar = tk.Scrollbar(self.status_frame, command=self.status_text.yview)
         self.status_scrollbar.grid(row=2, column=2, sticky='NWS', padx=5, pady=5)
@@ -629,14 +699,8 @@ class GameFrame(tk.Frame):
         self.chat_text = tk.Text(self.chat_frame, height=8, width=54, font=BODY_FONT)
         self.chat_text.bind("<Key>", lambda e: "break")  # Set as read-only for user
         # Set chat text options
-        self.chat_text.tag_configure("player-Red", justify="right", foreground="red")
-        self.chat_text.tag_configure("player-Blue", justify="right", foreground="blue")
-        self.chat_text.tag_configure("player-Green", justify="right", foreground="green")
-        self.chat_text.tag_configure("player-Purple", justify="right", foreground="purple")
-        self.chat_text.tag_configure("other-Red", justify="left", foreground="red")
-        self.chat_text.tag_configure("other-Blue", justify="left", foreground="blue")
-        self.chat_text.tag_configure("other-Green", justify="left", foreground="green")
-        self.chat_text.tag_configure("other-Purple", justify="left", foreground="purple")
+        self.chat_text.tag_configure("player", justify="right")
+        self.chat_text.tag_configure("other", justify="left")
 
         self.chat_text.grid(row=2, column=1, sticky='W', padx=5)
         self.chat_scrollbar = tk.Scrollbar(self.chat_frame, command=self.chat_text.yview)
@@ -661,166 +725,215 @@ class GameFrame(tk.Frame):
 
 
 def update_gui(controller):
-    global game_end
     game_frame = controller.frames["Game"]
 
+    if push_updates:  # Updates were pushed by the server, only the local queue is checked
+        state_list, chat_list = get_pushed_updates()
+    else:  # Poll the server for updates
+        state_list = request_game_updates()
+        chat_list = request_chat_updates()
+
     # UPDATE 1 (MOVES)
-    connection_socket.send("UPDATE_GAME".encode())
-    game_msg = connection_socket.recv(recv_buffer).decode()
+    if state_list:
+        show_game_updates(controller, state_list)
+    # UPDATE 2 (CHAT LOG)
+    if chat_list:
+        show_chat_messages(controller, chat_list)
+
+    if not game_end:
+        app.after(50, update_gui, controller)
+    else:  # Send Terminating Command
+        protocol.send_message(connection_socket, "END_GAME")
+        end_msg = protocol.recv_message(connection_socket)
+        # TODO: END GAME DIALOG
+        print_action("\nClosing Battleship Game Client")
+        game_frame.status_text.insert(tk.END, "Closing window in 15 seconds...")
+        game_frame.status_text.see(tk.END)
+        app.after(15000, close_app)
+
+
+# Ask the server for new game state messages, returns an empty list if there are none
+def request_game_updates():
+    global game_event_count
+    protocol.send_message(connection_socket, "UPDATE_GAME " + str(game_event_count))
+    game_msg = protocol.recv_message(connection_socket)
 
     if game_msg == "UPDATE":
-        board_selected_tokens = game_frame.board_cbox_value.get().split()
-        other_board_username = board_selected_tokens[0]
-
-        connection_socket.send("OK".encode())
-        # Receive each state notification
-        joined_state_list = connection_socket.recv(recv_buffer).decode()
-        state_list = joined_state_list.split('\n')
-        token_list = []
-
-        for state_msg in state_list:  # Add state message to state textbox, change display of boards accordingly
-            state_tokens = state_msg.split()
-            if state_tokens[0] == "HIT":
-                token_list.append("HIT")
-                attacker_username = state_tokens[1]
-                attacker_num, attacker_team = players[attacker_username]
-                defender_username = state_tokens[2]
-                row = int(state_tokens[3])
-                col = int(state_tokens[4])
-
-                game_frame.status_text.insert(tk.END, attacker_username + " HIT " + defender_username + "'s ship at " +
-                                              Game.rows[row] + str(col) + '\n', attacker_team)
-                game_frame.status_text.see(tk.END)
-                if defender_username == username:  # Update user's board
-                    game_frame.your_buttons[row-1][col-1].configure(bg=Game.move_markers["HIT"])
-                elif defender_username == other_board_username:  # Update other player's board
-                    game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["HIT"])
-
-            elif state_tokens[0] == "MISS":
-                token_list.append("MISS")
-                attacker_username = state_tokens[1]
-                attacker_num, attacker_team = players[attacker_username]
-                defender_username = state_tokens[2]
-                row = int(state_tokens[3])
-                col = int(state_tokens[4])
-
-                game_frame.status_text.insert(tk.END, attacker_username + " MISSED shooting " + defender_username +
-                                              " at " + Game.rows[row] + str(col) + '\n', attacker_team)
-                game_frame.status_text.see(tk.END)
+        # Receive each state notification, sent right after the notification
+        state_list = protocol.recv_message(connection_socket).split('\n')
+        game_event_count += len(state_list)
+        return state_list
+    return []
+
+
+# Ask the server for new chat messages, returns an empty list if there are none
+def request_chat_updates():
+    protocol.send_message(connection_socket, "UPDATE_CHAT")
+    update_msg = protocol.recv_message(connection_socket)
+
+    if update_msg == "UPDATE":
+        # Every waiting chat message is sent in one JSON list right after the notification
+        return json.loads(protocol.recv_message(connection_socket))
+    return []
+
+
+# Subscribe to game state and chat messages pushed by the server, returns False if the server refused
+def subscribe_updates():
+    global push_socket
+    try:
+        push_socket = socket(AF_INET, SOCK_STREAM)
+        push_socket.connect((hostname, push_port))
+        protocol.send_message(push_socket, "SUBSCRIBE " + room_id + ' ' + str(player_num))
+        if protocol.recv_message(push_socket) != "OK":
+            push_socket.close()
+            return False
+    except OSError as e:
+        print_action("Socket error: " + str(e), "ERROR")
+        return False
+
+    # Receive pushed messages on a background thread, the GUI reads them from the push queue
+    threading.Thread(target=receive_pushed_updates, daemon=True).start()
+    print_action("Subscribed to pushed updates")
+    return True
+
+
+def receive_pushed_updates():
+    try:
+        while True:
+            kind, msg = protocol.recv_message(push_socket).split(' ', 1)
+            push_queue.put((kind, msg))
+    except ConnectionError:  # Server closes the push connection once the game ends
+        print_action("Push connection closed")
+    except (OSError, ValueError) as e:
+        print_action("Push connection error: " + str(e), "ERROR")
+
+
+# Take every pushed message out of the push queue, returns the game state and chat messages
+def get_pushed_updates():
+    state_list = []
+    chat_list = []
+    while True:
+        try:
+            kind, msg = push_queue.get_nowait()
+        except queue.Empty:
+            break
+        if kind == "GAME":
+            state_list.append(msg)
+        else:
+            chat_list.append(msg)
+    return state_list, chat_list
+
+
+# Add state messages to state textbox, change display of boards accordingly
+def show_game_updates(controller, state_list):
+    global game_end
+    game_frame = controller.frames["Game"]
+    board_selected_tokens = game_frame.board_cbox_value.get().split()
+    other_board_username = board_selected_tokens[0]
+    token_list = []
+
+    for state_msg in state_list:  # Add state message to state textbox, change display of boards accordingly
+        state_tokens = state_msg.split()
+        if state_tokens[0] == "HIT":
+            token_list.append("HIT")
+            attacker_username = state_tokens[1]
+            attacker_num, attacker_team = players[attacker_username]
+            defender_username = state_tokens[2]
+            row = int(state_tokens[3])
+            col = int(state_tokens[4])
+
+            game_frame.status_text.insert(tk.END, attacker_username + " HIT " + defender_username + "'s ship at " +
+                                          Board.row_label(row) + str(col) + '\n', attacker_team)
+            game_frame.status_text.see(tk.END)
+            if defender_username == username:  # Update user's board
+                game_frame.your_board.set_cell(row, col, Game.move_markers["HIT"])
+            elif defender_username == other_board_username:  # Update other player's board
+                game_frame.other_board.set_cell(row, col, Game.move_markers["HIT"])
+
+        elif state_tokens[0] == "MISS":
+            token_list.append("MISS")
+            attacker_username = state_tokens[1]
+            attacker_num, attacker_team = players[attacker_username]
+            defender_username = state_tokens[2]
+            row = int(state_tokens[3])
+            col = int(state_tokens[4])
+
+            game_frame.status_text.insert(tk.END, attacker_username + " MISSED shooting " + defender_username +
+                                          " at " + Board.row_label(row) + str(col) + '\n', attacker_team)
+            game_frame.status_text.see(tk.END)
+            if defender_username == username:  # Update user's board
+                game_frame.your_board.set_cell(row, col, Game.move_markers["MISS"])
+            elif defender_username == other_board_username:  # Update other player's board
+                game_frame.other_board.set_cell(row, col, Game.move_markers["MISS"])
+
+        elif state_tokens[0] == "SUNK":
+            token_list.append("SUNK")
+            attacker_username = state_tokens[1]
+            attacker_num, attacker_team = players[attacker_username]
+            defender_username = state_tokens[2]
+            ship = state_tokens[3]
+
+            game_frame.status_text.insert(tk.END, attacker_username + " SUNK " + defender_username +
+                                          "'s " + ship + '\n', attacker_team)
+            game_frame.status_text.see(tk.END)
+            # process coordinates
+            for coord in state_tokens[4:]:
+                coords = coord.split('_')
+                row = int(coords[0])
+                col = int(coords[1])
                 if defender_username == username:  # Update user's board
-                    game_frame.your_buttons[row - 1][col - 1].configure(bg=Game.move_markers["MISS"])
+                    game_frame.your_board.set_cell(row, col, Game.move_markers["SUNK"])
                 elif defender_username == other_board_username:  # Update other player's board
-                    game_frame.other_buttons[row - 1][col - 1].configure(bg=Game.move_markers["MISS"])
+                    game_frame.other_board.set_cell(row, col, Game.move_markers["SUNK"])
 
-            elif state_tokens[0] == "SUNK":
-                token_list.append("SUNK")
-                attacker_username = state_tokens[1]
-                attacker_num, attacker_team = players[attacker_username]
-                defender_username = state_tokens[2]
-                ship = state_tokens[3]
+        elif state_tokens[0] == "ELIM_PLAYER":
+            token_list.append("ELIM_PLAYER")
+            attacker_username = state_tokens[1]
+            attacker_num, attacker_team = players[attacker_username]
+            defender_username = state_tokens[2]
 
-                game_frame.status_text.insert(tk.END, attacker_username + " SUNK " + defender_username +
-                                              "'s " + ship + '\n', attacker_team)
-                game_frame.status_text.see(tk.END)
-                # process coordinates
-                for coord in state_tokens[4:]:
-                    coords = coord.split('_')
-                    row = int(coords[0]) - 1
-                    col = int(coords[1]) - 1
-                    if defender_username == username:  # Update user's board
-                        game_frame.your_buttons[row][col].configure(bg=Game.move_markers["SUNK"])
-                    elif defender_username == other_board_username:  # Update other player's board
-                        game_frame.other_buttons[row][col].configure(bg=Game.move_markers["SUNK"])
-
-            elif state_tokens[0] == "ELIM_PLAYER":
-                token_list.append("ELIM_PLAYER")
-                attacker_username = state_tokens[1]
-                attacker_num, attacker_team = players[attacker_username]
-                defender_username = state_tokens[2]
-
-                game_frame.status_text.insert(tk.END, attacker_username + " has ELIMINATED " + defender_username + '\n',
-                                              attacker_team)
-                game_frame.status_text.see(tk.END)
+            game_frame.status_text.insert(tk.END, attacker_username + " has ELIMINATED " + defender_username + '\n',
+                                          attacker_team)
+            game_frame.status_text.see(tk.END)
 
-            elif state_tokens[0] == "ELIM_TEAM":
-                token_list.append("ELIM_TEAM")
-                game_frame.status_text.insert(tk.END, "Team " + state_tokens[1] + " has ELIMINATED Team " +
-                                              state_tokens[2] + '\n', state_tokens[1])
-                game_frame.status_text.see(tk.END)
+        elif state_tokens[0] == "ELIM_TEAM":
+            token_list.append("ELIM_TEAM")
+            game_frame.status_text.insert(tk.END, "Team " + state_tokens[1] + " has ELIMINATED Team " +
+                                          state_tokens[2] + '\n', state_tokens[1])
+            game_frame.status_text.see(tk.END)
 
-            elif state_tokens[0] == "GAME_END":
-                token_list.append("GAME_END")
-                game_frame.status_text.insert(tk.END, "Game has Ended. The winners are Team " + state_tokens[1] + '!\n',
-                                              state_tokens[1])
-                game_frame.status_text.see(tk.END)
-                game_end = True
+        elif state_tokens[0] == "GAME_END":
+            token_list.append("GAME_END")
+            game_frame.status_text.insert(tk.END, "Game has Ended. The winners are Team " + state_tokens[1] + '!\n',
+                                          state_tokens[1])
+            game_frame.status_text.see(tk.END)
+            game_end = True
 
-            elif state_tokens[0] == "TURN_CHANGE":
-                token_list.append("TURN_CHANGE")
-                game_frame.status_text.insert(tk.END, "[TURN " + str(state_tokens[1]) + "] Current turn: Team " +
-                                              state_tokens[2] + '\n', state_tokens[2])
+        elif state_tokens[0] == "TURN_CHANGE":
+            token_list.append("TURN_CHANGE")
+            game_frame.status_text.insert(tk.END, "[TURN " + str(state_tokens[1]) + "] Current turn: Team " +
+                                          state_tokens[2] + '\n', state_tokens[2])
+            game_frame.status_text.see(tk.END)
+            if state_tokens[2] == team:
+                game_frame.status_text.insert(tk.END, "\tWaiting for your move\n", team)
                 game_frame.status_text.see(tk.END)
-                if state_tokens[2] == team:
-                    game_frame.status_text.insert(tk.END, "\tWaiting for your move\n", team)
-                    game_frame.status_text.see(tk.END)
-        print_action("Updated Game " + str(token_list))
-
+    print_action("Updated Game " + str(token_list), "DEBUG")
 
-    # UPDATE 2 (CHAT LOG)
-    connection_socket.send("UPDATE_CHAT".encode())
-    update_msg = connection_socket.recv(recv_buffer).decode()
 
-    if update_msg == "UPDATE":
-        # Create chat socket, send address to server
-        try:
-            chat_socket = socket(AF_INET, SOCK_DGRAM)
-            chat_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-            host = gethostname()
-            host_address = gethostbyname(host)
-            chat_socket.bind((host_address, chat_port_min + player_num))
-
-            connection_socket.send(host_address.encode())  # Send over client address
-            chat_msg = ""
-            chat_list = []
-            while True:  # Receive each chat message that needs to be appended to chat log
-                if chat_msg == "SEND COMPLETE":
-                    break
-                else:
-                    chat_msg, srv_addr = chat_socket.recvfrom(recv_buffer)
-                    chat_msg = chat_msg.decode()
-                    if chat_msg != "SEND COMPLETE":
-                        chat_list.append(chat_msg)
-
-            ok_msg = connection_socket.recv(recv_buffer).decode()
-            chat_socket.close()
-        except OSError as e:
-            connection_socket.close()
-            print_action("Socket error: " + str(e))
-            sys.exit(1)
-
-        for msg in chat_list:
-            # Determine writer of message
-            chat_tokens = msg.split()
-            user = chat_tokens[0][1:]
-            p_num, p_team = players[user]
-            # Update chat
-            if p_num == player_num:
-                game_frame.chat_text.insert(tk.END, msg, 'player-' + p_team)
-            else:
-                game_frame.chat_text.insert(tk.END, msg, 'other-' + p_team)
-            game_frame.chat_text.see(tk.END)
-            print_action("Updated chat message: " + msg.strip('\n'))
-
-    if not game_end:
-        app.after(50, update_gui, controller)
-    else:  # Send Terminating Command
-        connection_socket.send("END_GAME".encode())
-        end_msg = connection_socket.recv(recv_buffer).decode()
-        # TODO: END GAME DIALOG
-        print_action("\nClosing Battleship Game Client")
-        game_frame.status_text.insert(tk.END, "Closing window in 15 seconds...")
-        game_frame.status_text.see(tk.END)
-        app.after(15000, close_app)
+def show_chat_messages(controller, chat_list):
+    game_frame = controller.frames["Game"]
+    for msg in chat_list:
+        # Determine writer of message
+        chat_tokens = msg.split()
+        user = chat_tokens[0][1:]
+        p_num, p_team = players[user]
+        # Update chat
+        if p_num == player_num:
+            game_frame.chat_text.insert(tk.END, msg, ('player', 'team-' + p_team))
+        else:
+            game_frame.chat_text.insert(tk.END, msg, ('other', 'team-' + p_team))
+        game_frame.chat_text.see(tk.END)
+        print_action("Updated chat message: " + msg.strip('\n'), "DEBUG")
 
 
 def make_move(controller, row, col):
@@ -832,9 +945,9 @@ def make_move(controller, row, col):
             game_frame.status_text.insert(tk.END, "ERROR: Can't shoot allied player\n")
             game_frame.status_text.see(tk.END)
         else:
-            connection_socket.send(("MOVE " + str(defender_num) + ' ' + str(row) + ' ' + str(col)).encode())
+            protocol.send_message(connection_socket, "MOVE " + str(defender_num) + ' ' + str(row) + ' ' + str(col))
             print_action("Sent move: " + board_selected_tokens[0] + ' ' + str(row) + ' ' + str(col))
-            move_msg = connection_socket.recv(recv_buffer).decode()
+            move_msg = protocol.recv_message(connection_socket)
             if move_msg == "NOT_YOUR_TURN":
                 game_frame.status_text.insert(tk.END, "ERROR: It is not your turn\n")
                 game_frame.status_text.see(tk.END)
@@ -847,6 +960,9 @@ def make_move(controller, row, col):
             elif move_msg == "ENEMY_IS_DEAD":
                 game_frame.status_text.insert(tk.END, "ERROR: " + board_selected_tokens[0] + " is already dead\n")
                 game_frame.status_text.see(tk.END)
+            elif move_msg == "INVALID_MOVE":
+                game_frame.status_text.insert(tk.END, "ERROR: That cell is not on the board\n")
+                game_frame.status_text.see(tk.END)
 
 
 def update_other_board(controller):
@@ -857,85 +973,49 @@ def update_other_board(controller):
 
         current_other_user = game_frame.other_label.cget("text").split("'")
         if current_other_user[0] != board_selected_tokens[0]:  # Skip update if current board is same as user choice
-            if other_team == team:
-                connection_socket.send(("NEW_BOARD " + str(other_num) + ' ' + "ALLY").encode())
-                grid_msg = connection_socket.recv(recv_buffer).decode()
-                connection_socket.send("SHIP_COORDS".encode())  # Request for ship coordinates
-                json_ship = connection_socket.recv(recv_buffer).decode()
-                ship_coords = json.loads(json_ship)  # Convert json string to ship coords dict
-
-                grid_rows = grid_msg.split('\n')  # Un-package the string back to a 2D list
-                for row in range(1, 11):
-                    cols = grid_rows[row].split()
-                    for col in range(1, 11):
-                        if cols[col] == Player.c_state["Empty"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["DEFAULT"])
-                        elif cols[col] == Player.c_state["Hit"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["HIT"])
-                        elif cols[col] == Player.c_state["Miss"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["MISS"])
-                        elif cols[col] == Player.c_state["Sunk"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["SUNK"])
-                # Run through ship coordinates for their specific ship colors
+            # Ask only for the changes since the copy of the board received last time
+            cached = board_cache.get(other_num)
+            board_msg = "NEW_BOARD " + str(other_num) + ' ' + ("ALLY" if other_team == team else "ENEMY")
+            if cached is not None:
+                board_msg += ' ' + str(cached[0])
+            protocol.send_message(connection_socket, board_msg)
+            board_update = protocol.recv_message_bytes(connection_socket)
+            if other_team == team and cached is None:  # Ship coordinates follow an ally's first board
+                ally_ship_coords[other_num] = json.loads(protocol.recv_message(connection_socket))
+            version, cells = Board.apply_update(board_update, cached[1] if cached is not None else None)
+            board_cache[other_num] = (version, cells)
+
+            game_frame.other_board.show_cells(cells)
+            if other_team == team:  # Run through ship coordinates for their specific ship colors
+                ship_coords = ally_ship_coords[other_num]
                 for ship in ship_coords:
                     for coord in ship_coords[ship]:
                         coord_tokens = coord.split('_')
-                        game_frame.other_buttons[int(coord_tokens[0])-1][int(coord_tokens[1])-1].configure(
-                            bg=Game.ship_color[ship])
-
-            else:
-                connection_socket.send(("NEW_BOARD " + str(other_num) + ' ' + "ENEMY").encode())
-                grid_msg = connection_socket.recv(recv_buffer).decode()
-
-                grid_rows = grid_msg.split('\n')  # Un-package the string back to a 2D list
-                for row in range(1, 11):
-                    cols = grid_rows[row].split()
-                    for col in range(1, 11):
-                        if cols[col] == Player.c_state["Hit"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["HIT"])
-                        elif cols[col] == Player.c_state["Miss"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["MISS"])
-                        elif cols[col] == Player.c_state["Sunk"]:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["SUNK"])
-                        else:
-                            game_frame.other_buttons[row-1][col-1].configure(bg=Game.move_markers["DEFAULT"])
+                        game_frame.other_board.set_cell(int(coord_tokens[0]), int(coord_tokens[1]), ship_colors[ship])
 
             # Update board label
-            game_frame.other_label.configure(text=(board_selected_tokens[0] + "'s Board"), fg=other_team)
-            print_action("Updated board display: " + board_selected_tokens[0])
+            game_frame.other_label.configure(text=(board_selected_tokens[0] + "'s Board"), fg=team_color(other_team))
+            print_action("Updated board display: " + board_selected_tokens[0], "DEBUG")
 
 
 def add_to_chat(controller):
     if not game_end:
         game_frame = controller.frames["Game"]
-        # Send notification of wanting to send chat message
+        # The chat command and its message are sent together, the message follows the first line
         if game_frame.chat_type_cbox_value.get() == "ENEMY":
-            connection_socket.send(("CHAT ENEMY " + game_frame.send_to_cbox_value.get() + ' ' + team).encode())
+            chat_cmd = "CHAT ENEMY " + game_frame.send_to_cbox_value.get() + ' ' + team
         else:
-            connection_socket.send(("CHAT " + game_frame.chat_type_cbox_value.get()).encode())
-
-        # Create chat socket
-        try:
-            chat_socket = socket(AF_INET, SOCK_DGRAM)
-            chat_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-            #  Wait for socket to be created in server
-            send_msg = connection_socket.recv(recv_buffer).decode()
-
-            # Send the chat message over to the server
-            chat_socket.sendto(game_frame.chat_input_text.get("1.0", tk.END).encode(), (hostname, chat_port_min + player_num))
-            chat_socket.close()
-        except OSError as e:
-            connection_socket.close()
-            print_action("Socket error: " + str(e))
-            sys.exit(1)
+            chat_cmd = "CHAT " + game_frame.chat_type_cbox_value.get()
+        protocol.send_message(connection_socket, chat_cmd + '\n' + game_frame.chat_input_text.get("1.0", tk.END))
         # Clear the chat input box
         print_action("Sent chat message: " + game_frame.chat_input_text.get("1.0", tk.END).strip('\n'))
         game_frame.chat_input_text.delete("1.0", tk.END)
-        ok_msg = connection_socket.recv(recv_buffer).decode()
+        ok_msg = protocol.recv_message(connection_socket)
 
 
 def configure():
-    global hostname, server_port, chat_port_min, configfile, configs, logfile, recv_buffer
+    global hostname, server_port, configfile, configs, logfile, push_port, push_updates, \
+           room_id, log_level, log_flush_interval
 
     configfile = get_pathname(configfile)
     if not os.path.exists(configfile):
@@ -946,20 +1026,22 @@ def configure():
 
     hostname = configs['CLIENT']['HOST_NAME']
     server_port = int(configs['CLIENT']['SERVER_PORT'])
-    chat_port_min = int(configs['CLIENT']['CHAT_PORT_MIN'])
+    push_port = int(configs['CLIENT'].get('PUSH_PORT', '0'))
+    push_updates = configs['CLIENT'].getboolean('PUSH_UPDATES', fallback=False) and push_port != 0
 
     logfile = get_pathname(configs['CLIENT']['PATH_LOG'])
     if not os.path.exists(logfile):
         print("Error: log file not found. Exiting...")
         sys.exit(1)
+    log_level = configs['CLIENT'].get('LOG_LEVEL', 'INFO').upper()
+    log_flush_interval = float(configs['CLIENT'].get('LOG_FLUSH_INTERVAL', '1'))
 
-    recv_buffer = int(configs['CLIENT']['RECV_BUFFER'])
+    room_id = configs['CLIENT'].get('ROOM_ID', '').strip()
 
 
-def print_action(msg):
-    print(msg)
-    with open(logfile, "at") as f_log:
-        f_log.write(msg + '\n')
+# Queue a record for the log, levels = DEBUG, INFO, ERROR
+def print_action(msg, level="INFO"):
+    action_logger.log(msg, level)
 
 
 # Convert pathname to correct pathname
@@ -987,6 +1069,7 @@ if __name__ == "__main__":
     f_log.write('Beginning Battleship Client Session\n')
     f_log.close()
     print('Beginning Battleship Client Session')
+    action_logger = ActionLogger(logfile, log_flush_interval, log_level)
 
     app = BattleshipApp()
     app.mainloop()
\ No newline at end of file
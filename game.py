@@ -1,24 +1,39 @@
 # Game - object represents the current game state
 import random
+import threading
+from locks import make_lock
 
 class Game():
     # Static Variables
+    # Classic fleet, games can be given their own board size and fleet (see the server's BOARD_SIZE and FLEET)
     ships = ["carrier", "battleship", "cruiser", "submarine", "destroyer"]
     ship_size = {"carrier": 5, "battleship": 4, "cruiser": 3, "submarine": 3, "destroyer": 2}
     ship_color = {"carrier": "cyan", "battleship": "green", "cruiser": "purple", "submarine": "blue", "destroyer": "yellow"}
-    team_colors = ["Red", "Blue", "Green", "Purple"]
+    team_colors = ["Red", "Blue", "Green", "Purple"]  # Teams offered by the client, any other team name works too
     move_markers = {"HIT": "red", "MISS": "dark gray", "SUNK": "black", "DEFAULT": "SystemButtonFace"}
-    rows = ["+", "A", "B", "C", "D", "E", "F", "G", "H", "I", "J"]
-    row_map = {"A": 1, "B": 2, "C": 3, "D": 4, "E": 5, "F": 6, "G": 7, "H": 8, "I": 9, "J": 10}
     cardinals = ["N", "S", "W", "E"]
+    phases = ["JOIN", "SETUP", "PLAY", "END"]  # Game phases, in the order they are entered
+    phase_order = {phase: i for i, phase in enumerate(phases)}
 
-    def __init__(self, player_count):
+    def __init__(self, player_count, board_size=10, fleet=None):
         self.player_count = player_count
+        # Board size and fleet of this game, fleet is a dict of ship -> ship size in the order ships are placed
+        self.board_size = board_size
+        self.ship_size = dict(fleet or Game.ship_size)
+        self.ships = list(self.ship_size)
         self.players = {}  # key: player num, value: player object
         self.player_update = {} # key: player object, value: need update (T) or up to date (F)
         self.teams = {}  # key: team color, value: list of players (by player_num)
         self.teams_alive = {}  # key: team color, alive (T) or dead (F)
+        self.team_players_alive = {}  # key: team color, value: number of players on the team still alive
+        # Ring of the teams still alive in turn order, a team is unlinked from it when eliminated
+        self.next_team = {}  # key: team color, value: next team alive when the team was last in the ring
+        self.prev_team = {}  # key: team color, value: previous team alive
+        self.alive_team_count = 0
         self.team_turn = None  # Keeps track of whose turn it is
+        self.moves_left = 0  # Living players of the team on turn that have not moved this turn
+        # Team turns played so far, a player has taken their turn if they moved in the current one
+        self.turn_serial = 0
         self.first_team_turn = None  # Keeps track of which team took the first turn
         self.turn_count = 1  # Current turn count
         self.team_winner = None
@@ -26,11 +41,84 @@ class Game():
         self.player_join_count = 0  # Keep track of players ready to transition to setup phase
         self.player_ready_count = 0  # Keep track of players ready to transition to game phase
         self.player_end_count = 0  # Keep track of players ready to transition to end phase
-        self.game_setup = False
-        self.game_start = False
-        self.game_end = False
+        self.phase = "JOIN"
+        self.cancelled = False  # Set if the game ended before setup because there were not enough teams
+        self.phase_cond = threading.Condition()  # Wakes threads waiting for a phase change
+        self.phase_listeners = []  # Functions called with the new phase on every phase change
+        self.subscribers = {}  # key: player num, value: function pushing ("GAME" or "CHAT", message) to the player
+        self.bots = {}  # key: player num of a computer player, value: bot choosing its moves (see bots.py)
+        # Append-only log of game state messages, each player reads it from their own event cursor
+        # Appended under the game lock, readers slice it without locking since entries never change
+        self.events = []
+        # Append-only log of chat messages as (chat type, sender player, enemy team, message), stored once
+        # Chat types = ALL, ALLIES, ENEMY, each player reads the messages meant for them from their chat cursor
+        self.chat_log = []
+        # Guards joining, turn order and moves of this game, boards and buffers are guarded by each player's locks
+        self.lock = make_lock("game")
 
         self.player_nums = 0
+        self.players_left = 0  # Players that left before the setup phase, their seats are taken by new players
+
+    @property
+    def game_setup(self):
+        return self.reached_phase("SETUP")
+
+    @property
+    def game_start(self):
+        return self.reached_phase("PLAY")
+
+    @property
+    def game_end(self):
+        return self.reached_phase("END")
+
+    # Returns True if the game is in the given phase or a later one
+    def reached_phase(self, phase):
+        return Game.phase_order[self.phase] >= Game.phase_order[phase]
+
+    # Move the game forward to the given phase, waking every waiting thread and notifying listeners
+    def set_phase(self, phase):
+        with self.phase_cond:
+            if self.reached_phase(phase):
+                return False
+            self.phase = phase
+            self.phase_cond.notify_all()
+        for listener in list(self.phase_listeners):
+            listener(phase)
+        return True
+
+    # Block until the game reaches the given phase, returns False if the timeout expired first
+    def wait_for_phase(self, phase, timeout=None):
+        with self.phase_cond:
+            return self.phase_cond.wait_for(lambda: self.reached_phase(phase), timeout)
+
+    def add_phase_listener(self, listener):
+        self.phase_listeners.append(listener)
+
+    def remove_phase_listener(self, listener):
+        if listener in self.phase_listeners:
+            self.phase_listeners.remove(listener)
+
+    # Count a joined player, go to setup phase once everyone has joined
+    def player_joined(self):
+        self.player_join_count += 1
+        if self.player_join_count == self.player_count:
+            if self.enough_teams():
+                self.set_phase("SETUP")
+            else:  # Not enough teams, cancel the game
+                self.cancelled = True
+                self.set_phase("END")
+
+    # Count a player that has placed their ships, start the game once everyone is ready
+    def player_ready(self):
+        self.player_ready_count += 1
+        if self.player_ready_count == self.player_count:
+            # Randomly designate first team
+            self.select_first_team()
+            self.set_phase("PLAY")
+
+    # True once every human player has left the end phase, bots never send END_GAME
+    def all_players_ended(self):
+        return self.player_end_count >= self.player_count - len(self.bots)
 
     def assign_player_num(self):
         self.player_nums += 1
@@ -40,6 +128,26 @@ class Game():
         self.players[player_num] = player
         self.player_update[player] = False
 
+    # Undo the join of a player that left before the setup phase, freeing their seat for a new player
+    # Player numbers are not given out again, only the seat counts
+    def remove_player(self, player_num):
+        self.players_left += 1
+        player = self.players.pop(player_num, None)
+        if player is None:  # Left before joining
+            return
+        del self.player_update[player]
+        self.teams[player.team].remove(player_num)
+        self.team_players_alive[player.team] -= 1
+        if not self.teams[player.team]:
+            del self.teams[player.team]
+            del self.teams_alive[player.team]
+            del self.team_players_alive[player.team]
+        self.player_join_count -= 1
+
+    # Seats given to players so far, not counting the players that left before the setup phase
+    def seats_taken(self):
+        return self.player_nums - self.players_left
+
     def get_player(self, player_num):
         return self.players[player_num]
 
@@ -47,105 +155,189 @@ class Game():
         if team not in self.teams:
             self.teams[team] = []
             self.teams_alive[team] = True
+            self.team_players_alive[team] = 0
 
         team_list = self.teams[team]
         team_list.append(player_num)
+        self.team_players_alive[team] += 1
 
     def enough_teams(self):
-        if len(list(self.teams.keys())) > 1:
+        if len(self.teams) > 1:
             return True
         else:
             return False
 
+    # Team names for a game of team_count teams, the team colors first
+    @staticmethod
+    def team_names(team_count):
+        return Game.team_colors[:team_count] + ["Team" + str(i + 1) for i in range(len(Game.team_colors), team_count)]
+
     def select_first_team(self):
-        # Randomly select a team to be first
+        # Link the teams into the turn ring in the order they joined
         team_list = list(self.teams.keys())
+        for i, team in enumerate(team_list):
+            self.next_team[team] = team_list[(i + 1) % len(team_list)]
+            self.prev_team[team] = team_list[i - 1]
+        self.alive_team_count = len(team_list)
+        # Randomly select a team to be first
         self.team_turn = team_list[random.randrange(len(team_list))]
         self.first_team_turn = self.team_turn
+        self.start_team_turn()
 
     def get_current_team_turn(self):
         return self.team_turn
 
+    # Called with the game lock held
     def make_move(self, attacker, defender, row, col):
-        msg = defender.set_move(row, col)
+        with defender.board_lock:
+            msg = defender.set_move(row, col)
         # Update state buffers for every player
-        self.add_to_state_buffer(msg + ' ' + attacker.username + ' ' + defender.username + ' ' +
+        self.add_event(msg + ' ' + attacker.username + ' ' + defender.username + ' ' +
                                  str(row) + ' ' + str(col))
         self.game_update(attacker, defender)  # Update the game state
 
     def game_update(self, attacker, defender):
         # Update ship state for updating player, update state buffer for every player
-        sunk_msg = defender.update_ship_state(attacker)
+        with defender.board_lock:
+            sunk_msg = defender.update_ship_state(attacker)
         sunk_tokens = sunk_msg.split()
+        attacker.moved_turn = self.turn_serial  # Set attacker turn as taken
+        self.moves_left -= 1
         if sunk_tokens[0] == "SUNK":
-            self.add_to_state_buffer(sunk_msg)
+            self.add_event(sunk_msg)
 
             # Check if defending player in team with updating player is still alive
             if defender.check_if_dead():
-                self.add_to_state_buffer("ELIM_PLAYER " + attacker.username + ' ' + defender.username)
+                self.add_event("ELIM_PLAYER " + attacker.username + ' ' + defender.username)
+                if defender.team == self.team_turn and not self.has_taken_turn(defender):
+                    self.moves_left -= 1  # A teammate shot before their move is not waited for
                 # Check if team has been eliminated as well
+                self.team_players_alive[defender.team] -= 1
                 if self.teams_alive[defender.team]:
-                    team_alive = False
-                    player_list = self.teams[defender.team]
-                    for player_num in player_list:
-                        if self.players[player_num].is_alive:
-                            team_alive = True
-                            break
-                    if not team_alive:
+                    if self.team_players_alive[defender.team] == 0:
                         self.teams_alive[defender.team] = False
-                        self.add_to_state_buffer("ELIM_TEAM " + attacker.team + ' ' + defender.team)
+                        self.add_event("ELIM_TEAM " + attacker.team + ' ' + defender.team)
+                        self.remove_team(defender.team)
 
                         # Check if game is over
-                        self.is_game_over()
+                        self.is_game_over(defender.team)
 
-        attacker.taken_turn = True  # Set attacker turn as taken
         # If game is not over from move, check if team's turn is over
         if not self.game_end:
             self.check_team_taken_turn()
 
-    def is_game_over(self):
-        alive_count = 0
-        winning_team = None
-        for team in self.teams_alive:
-            if self.teams_alive[team]:
-                alive_count += 1
-                winning_team = team
-        if alive_count == 1: # Game has ended
-            # Set the team winner
+    # Unlink an eliminated team from the turn ring, its next team stays set so the turn can move on
+    # from it if it was eliminated on its own turn
+    def remove_team(self, team):
+        prev_team = self.prev_team[team]
+        next_team = self.next_team[team]
+        self.next_team[prev_team] = next_team
+        self.prev_team[next_team] = prev_team
+        self.alive_team_count -= 1
+
+    def is_game_over(self, eliminated_team):
+        if self.alive_team_count == 1: # Game has ended
+            # Set the team winner, the only team left in the ring
+            winning_team = self.next_team[eliminated_team]
             self.team_winner = winning_team
-            self.add_to_state_buffer("GAME_END " + winning_team)
-            self.game_end = True
+            self.add_event("GAME_END " + winning_team)
+            self.set_phase("END")
+
+    # True if the player has moved in the current team turn
+    def has_taken_turn(self, player):
+        return player.moved_turn == self.turn_serial
 
     def check_team_taken_turn(self):
-        # Find current team's turn
-        index = self.get_current_team_turn()
-        turn_taken = True
-        for player_num in self.teams[index]:  # Determine if each player has taken their turn
-            if not self.players[player_num].taken_turn:
-                turn_taken = False
-                break
-        if turn_taken:
-            # Reset current team's turn taken flag, then change turn
-            for player_num in self.teams[index]:
-                self.players[player_num].taken_turn = False
+        if self.moves_left <= 0:  # Each player still alive has taken their turn
             self.change_team_turn()
 
     def change_team_turn(self):
-        # Find current team's turn
-        team_list = list(self.teams.keys())
-        index = team_list.index(self.get_current_team_turn())
-        while True: # Find next team that is alive
-            index = (index + 1) % len(team_list)
-            next_team = team_list[index]
-            if self.teams_alive[next_team]:  # Found next team's turn
-                self.team_turn = team_list[index]
-                if next_team == self.first_team_turn:  # All teams took their turn, increment turn counter
-                    self.turn_count += 1
-                # Add team change to state buffers
-                self.add_to_state_buffer("TURN_CHANGE " + str(self.turn_count) + ' ' + next_team)
-                break
-
-    def add_to_state_buffer(self, msg):
-        for player_num in self.players:
+        next_team = self.next_team[self.get_current_team_turn()]  # Next team that is alive
+        self.team_turn = next_team
+        if next_team == self.first_team_turn:  # All teams took their turn, increment turn counter
+            self.turn_count += 1
+        self.start_team_turn()
+        # Add team change to state buffers
+        self.add_event("TURN_CHANGE " + str(self.turn_count) + ' ' + next_team)
+
+    # Every living player of the team on turn has a move, none has taken it yet
+    def start_team_turn(self):
+        self.turn_serial += 1
+        self.moves_left = self.team_players_alive[self.team_turn]
+
+    # Push new game state and chat messages to the player as they happen instead of having them polled
+    # Anything the player has not read yet is pushed first
+    def subscribe(self, player_num, push):
+        player = self.players[player_num]
+        with player.cursor_lock:  # No message can be missed between the flush and the subscription
+            for msg in self.take_events(player):
+                push("GAME", msg)
+            for msg in self.take_chat(player):
+                push("CHAT", msg)
+            self.subscribers[player_num] = push
+
+    def unsubscribe(self, player_num):
+        with self.players[player_num].cursor_lock:
+            self.subscribers.pop(player_num, None)
+
+    # Push what subscribed players have not read yet of the game event log ("GAME") or chat log ("CHAT")
+    def push_to_subscribers(self, kind):
+        for player_num in list(self.subscribers):
             player = self.players[player_num]
-            player.add_state(msg)
\ No newline at end of file
+            with player.cursor_lock:
+                push = self.subscribers.get(player_num)
+                if push is not None:
+                    for msg in (self.take_events(player) if kind == "GAME" else self.take_chat(player)):
+                        push(kind, msg)
+
+    # Store a game state message once, subscribed players have it pushed right away
+    def add_event(self, msg):
+        self.events.append(msg)
+        self.push_to_subscribers("GAME")
+
+    # Game state messages the player has not read yet, a cursor given by the client replaces the player's cursor
+    def read_events(self, player_num, cursor=None):
+        player = self.players[player_num]
+        with player.cursor_lock:
+            if cursor is not None:
+                player.event_cursor = max(0, min(cursor, len(self.events)))
+            return self.take_events(player)
+
+    # Called with the player's cursor lock held
+    def take_events(self, player):
+        events = self.events[player.event_cursor:]
+        player.event_cursor += len(events)
+        return events
+
+    # Store a chat message once, enemy team is the team an ENEMY message is sent to
+    def add_chat(self, chat_type, sender, enemy_team, msg):
+        self.chat_log.append((chat_type, sender, enemy_team, msg))
+        self.push_to_subscribers("CHAT")
+
+    # Chat messages meant for the player they have not read yet, formatted for the player
+    # A cursor given by the client (the number of chat messages it already has, e.g. before reconnecting) replaces
+    # the player's cursor, the player's messages are then read from the start of the log
+    def read_chat(self, player_num, cursor=None):
+        player = self.players[player_num]
+        with player.cursor_lock:
+            if cursor is not None:
+                player.chat_cursor = 0
+                return self.take_chat(player)[max(cursor, 0):]
+            return self.take_chat(player)
+
+    # Called with the player's cursor lock held
+    def take_chat(self, player):
+        entries = self.chat_log[player.chat_cursor:]
+        player.chat_cursor += len(entries)
+        chat_list = []
+        for chat_type, sender, enemy_team, msg in entries:
+            if chat_type == "ALL":
+                chat_list.append("[" + sender.username + " (ALL)] " + msg)
+            elif chat_type == "ALLIES" and player.team == sender.team:
+                chat_list.append("[" + sender.username + " (ALLIES)] " + msg)
+            elif chat_type == "ENEMY":  # The enemy team and the sender's team see the message
+                if player.team == enemy_team:
+                    chat_list.append("[" + sender.username + " (FROM ENEMY - " + enemy_team + ")] " + msg)
+                if player.team == sender.team:
+                    chat_list.append("[" + sender.username + " (TO ENEMY - " + enemy_team + ")] " + msg)
+        return chat_list
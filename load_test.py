@@ -0,0 +1,309 @@
+# Load Test - headless players speaking the real client protocol against a running server
+# Each simulated player joins a room, sends a random fleet, polls UPDATE_GAME and UPDATE_CHAT like client.py,
+# fetches the boards changed by each move, moves on their team's turn, chats and ends the game with END_GAME
+# Before leaving, each player reads the chat history again with UPDATE_CHAT <cursor> like a reconnecting client
+# and checks it against the chat it received
+# Reports the throughput and the p50/p95/p99 latency of every command, optionally saved to a JSON results file
+# and compared against the results of an earlier run
+# Usage: python3 load_test.py [players] [players per game] [poll interval ms] [results file] [baseline file]
+#        [teams per game]
+# players per game must be the server's MAX_PLAYERS minus its BOT_PLAYERS, players are dealt to the teams in turn
+import configparser
+import json
+import os
+import random
+import sys
+import threading
+import time
+from socket import create_connection
+import protocol
+from board import Board
+from game import Game
+from placements import random_fleet
+
+configfile = os.path.join('client', 'conf', 'client.cfg')  # Server address is read from the client configuration
+chat_every = 5  # A player sends a chat message after every this many of their own moves
+
+
+# Latencies of every command, shared by every simulated player
+class LoadStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}  # key: command, value: seconds from sending the request to reading the whole reply
+        self.errors = []
+        self.games_ended = 0
+
+    def record(self, command, seconds):
+        with self.lock:
+            self.latencies.setdefault(command, []).append(seconds)
+
+    def error(self, msg):
+        with self.lock:
+            self.errors.append(msg)
+
+    # Count, rate and latency percentiles (milliseconds) of every command
+    def summary(self, elapsed):
+        commands = {}
+        with self.lock:
+            for command, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latencies)
+                commands[command] = {"count": len(latencies), "per_second": len(latencies) / elapsed,
+                                     "p50": percentile(latencies, 50) * 1000, "p95": percentile(latencies, 95) * 1000,
+                                     "p99": percentile(latencies, 99) * 1000, "max": latencies[-1] * 1000}
+            requests = sum(command["count"] for command in commands.values())
+            return {"elapsed": elapsed, "requests": requests, "requests_per_second": requests / elapsed,
+                    "games_ended": self.games_ended, "errors": len(self.errors), "commands": commands}
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# One simulated player on its own connection
+class LoadClient():
+    def __init__(self, host, port, username, team, room_id, stats, poll_interval, rng):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.team = team
+        self.room_id = room_id
+        self.stats = stats
+        self.poll_interval = poll_interval
+        self.rng = rng
+        self.connection_socket = None
+        self.player_num = None
+        self.rules = None  # Board size and fleet of the game, sent with the JOIN reply
+        self.players = {}  # key: username, value: (player num, team)
+        self.enemies = set()  # Player nums on other teams
+        self.team_position = (0, 1)  # (index of this player in their team, team size), teammates share out the cells
+        self.boards = {}  # key: player num, value: (board version, board cells) held
+        self.event_count = 0
+        self.chat = []  # Chat messages received so far
+        self.turn = 0  # Turns seen so far, the team turn changes on every turn
+        self.team_turn = None
+        self.moved_turn = -1  # Turn this player last moved in
+        self.alive = set()  # Player nums still alive
+        self.moves = 0
+        self.game_end = False
+
+    # Send a request and read its reply, a reply of UPDATE is followed by the update itself
+    def request(self, command, msg, binary=False):
+        start = time.perf_counter()
+        protocol.send_message(self.connection_socket, msg)
+        if binary:
+            reply = protocol.recv_message_bytes(self.connection_socket)
+        else:
+            reply = protocol.recv_message(self.connection_socket)
+            if reply == "UPDATE":
+                reply = protocol.recv_message(self.connection_socket)
+        self.stats.record(command, time.perf_counter() - start)
+        return reply
+
+    def run(self):
+        try:
+            self.connection_socket = create_connection((self.host, self.port), timeout=120)
+            if protocol.recv_message(self.connection_socket) != "SRDY":
+                raise ConnectionError("no SRDY from server")
+            if self.join() and self.setup():
+                self.play()
+        except (OSError, ValueError) as e:
+            self.stats.error(self.username + ": " + str(e))
+        finally:
+            if self.connection_socket is not None:
+                self.connection_socket.close()
+
+    def join(self):
+        while True:
+            reply = self.request("JOIN", "JOIN " + self.username + " " + self.team + " " + self.room_id)
+            reply, _, rules = reply.partition('\n')
+            reply = reply.split()
+            if reply and reply[0] in ("OK", "WAIT"):
+                self.player_num = int(reply[1])
+            if reply and reply[0] == "OK":
+                self.rules = json.loads(rules)
+                return True
+            elif not reply or reply[0] != "WAIT":
+                self.stats.error(self.username + ": join refused: " + " ".join(reply))
+                return False
+
+    def setup(self):
+        fleet = random_fleet(self.rng, self.rules["board_size"], self.rules["fleet"])
+        reply = self.request("FLEET", "FLEET\n" + "\n".join(ship + " " + " ".join(fleet[ship]) for ship in fleet))
+        if reply != "OK":
+            self.stats.error(self.username + ": fleet refused: " + reply)
+            return False
+        while self.request("SETUP", "SETUP") != "OK":
+            pass
+        game_state = json.loads(self.request("SEND INFO", "SEND INFO"))
+        for player_num in game_state["players"]:
+            username, team = game_state[str(player_num)]
+            self.players[username] = (player_num, team)
+            self.alive.add(player_num)
+            if team != self.team:
+                self.enemies.add(player_num)
+        team = game_state["teams"][self.team]
+        self.team_position = (team.index(self.player_num), len(team))
+        self.team_turn = game_state["first_turn"]
+        for player_num in game_state["players"]:
+            self.get_board(player_num)
+        self.check_enemy_delta()
+        self.check_bad_requests()
+        return True
+
+    def play(self):
+        while not self.game_end:
+            self.read_events(self.request("UPDATE_GAME", "UPDATE_GAME " + str(self.event_count)))
+            reply = self.request("UPDATE_CHAT", "UPDATE_CHAT")
+            if reply != "CHAT OK":
+                self.chat += json.loads(reply)
+            if not self.game_end and self.team_turn == self.team and self.moved_turn != self.turn and \
+                    self.player_num in self.alive:
+                self.move()
+            time.sleep(self.poll_interval)
+        self.check_chat_history()
+        self.request("END_GAME", "END_GAME")
+        with self.stats.lock:
+            self.stats.games_ended += 1
+
+    # Read the chat again from a cursor halfway through and from the start, the history must carry on with the
+    # messages received after the cursor (players still in the game may have sent more since)
+    def check_chat_history(self):
+        for cursor in (len(self.chat) // 2, 0):
+            reply = self.request("UPDATE_CHAT", "UPDATE_CHAT " + str(cursor))
+            history = json.loads(reply) if reply != "CHAT OK" else []
+            if history[:len(self.chat) - cursor] != self.chat[cursor:]:
+                self.stats.error(self.username + ": chat history from " + str(cursor) + " does not match")
+
+    def read_events(self, reply):
+        if reply == "GAME OK":
+            return
+        events = reply.split('\n')
+        self.event_count += len(events)
+        changed = set()
+        for event in events:
+            tokens = event.split()
+            if tokens[0] in ("HIT", "MISS", "SUNK"):
+                changed.add(self.players[tokens[2]][0])
+            elif tokens[0] == "ELIM_PLAYER":
+                self.alive.discard(self.players[tokens[2]][0])
+            elif tokens[0] == "TURN_CHANGE":
+                self.turn += 1
+                self.team_turn = tokens[2]
+            elif tokens[0] == "GAME_END":
+                self.game_end = True
+        for player_num in changed:  # Fetch the changed boards like the client's board refresh
+            self.get_board(player_num)
+
+    # A delta of an enemy board from version 0 covers the fleet placement, it must not list any ship cell
+    # (a cell of the delta that reads as empty can only be a hidden ship cell)
+    def check_enemy_delta(self):
+        for player_num in self.enemies:
+            update = self.request("NEW_BOARD", "NEW_BOARD " + str(player_num) + " ENEMY 0", binary=True)
+            if update[:1] == b'D':
+                cell_count = self.rules["board_size"] ** 2
+                if any(state == Board.EMPTY for index, state in Board.delta_entries(update, cell_count)):
+                    self.stats.error(self.username + ": enemy board delta lists ship cells of " + str(player_num))
+
+    # Malformed requests must be refused with UNKNOWN CODE, not drop the connection
+    def check_bad_requests(self):
+        for msg in ("UPDATE_GAME x", "UPDATE_GAME -1", "UPDATE_CHAT x", "UPDATE_CHAT 1 2", "NEW_BOARD 1",
+                    "NEW_BOARD 99 ENEMY", "NEW_BOARD " + str(self.player_num) + " ALLY x",
+                    "NEW_BOARD " + str(min(self.enemies)) + " ALLY"):
+            reply = self.request("UNKNOWN", msg)
+            if reply != "UNKNOWN CODE":
+                self.stats.error(self.username + ": " + msg + " answered with " + reply)
+
+    def get_board(self, player_num):
+        view = "ENEMY" if player_num in self.enemies else "ALLY"
+        version, cells = self.boards.get(player_num, (None, None))
+        msg = "NEW_BOARD " + str(player_num) + " " + view + ("" if version is None else " " + str(version))
+        self.boards[player_num] = Board.apply_update(self.request("NEW_BOARD", msg, binary=True), cells)
+        if view == "ALLY" and version is None:  # Allies' ship coordinates follow their first board
+            protocol.recv_message(self.connection_socket)
+
+    # Shoot a random cell of a random living enemy that is not marked on the board yet, like a player would
+    # Teammates move in the same turn, so each one keeps to their own share of the cells while it lasts
+    # since a hit cell shot a second time no longer counts as hit
+    def move(self):
+        defender_num = self.rng.choice([player_num for player_num in self.enemies if player_num in self.alive])
+        cells = self.boards[defender_num][1]
+        empty = [index for index in range(len(cells)) if cells[index] == Board.EMPTY]
+        position, team_size = self.team_position
+        share = [index for index in empty if index % team_size == position]
+        if not empty:
+            raise ValueError("no cells left to shoot on player " + str(defender_num))
+        cell = self.rng.choice(share or empty)
+        size = self.rules["board_size"]
+        row, col = cell // size + 1, cell % size + 1
+        reply = self.request("MOVE", "MOVE " + str(defender_num) + " " + str(row) + " " + str(col))
+        if reply == "MOVE_OK":
+            self.moved_turn = self.turn
+            self.moves += 1
+            if self.moves % chat_every == 0:
+                self.request("CHAT", "CHAT ALL\nload test message " + str(self.moves) + " from " + self.username)
+        elif reply in ("YOU_ARE_DEAD", "ALREADY_TAKEN_TURN", "NOT_YOUR_TURN"):
+            self.moved_turn = self.turn  # Wait for the next turn change before trying again
+
+
+# Run player_count simulated players in rooms of players_per_game, returns the summary of every command
+def run_load(host, port, player_count, players_per_game, poll_interval=0.05, seed=None, team_count=2):
+    stats = LoadStats()
+    rng = random.Random(seed)
+    run_id = format(rng.getrandbits(32), 'x')  # Keeps the rooms of each run apart
+    teams = Game.team_names(team_count)
+    threads = []
+    for i in range(player_count):
+        room_id = "load-" + run_id + "-" + str(i // players_per_game)
+        client = LoadClient(host, port, "load" + str(i), teams[i % players_per_game % team_count], room_id, stats,
+                            poll_interval, random.Random(rng.random()))
+        threads.append(threading.Thread(target=client.run, daemon=True))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.summary(time.perf_counter() - start), stats.errors
+
+
+def print_summary(summary, baseline=None):
+    print("Played for " + format(summary["elapsed"], ".1f") + "s: " + str(summary["requests"]) + " requests (" +
+          format(summary["requests_per_second"], ".0f") + "/s), " + str(summary["games_ended"]) + " players finished, " +
+          str(summary["errors"]) + " errors")
+    print("command       count    per s   p50 ms   p95 ms   p99 ms   max ms" + ("   p95 vs baseline" if baseline else ""))
+    for command, result in summary["commands"].items():
+        line = command.ljust(10) + str(result["count"]).rjust(8) + format(result["per_second"], ".0f").rjust(9)
+        for key in ("p50", "p95", "p99", "max"):
+            line += format(result[key], ".2f").rjust(9)
+        if baseline and command in baseline["commands"] and baseline["commands"][command]["p95"] > 0:
+            line += format(result["p95"] / baseline["commands"][command]["p95"] * 100 - 100, "+.0f").rjust(17) + "%"
+        print(line)
+
+
+def main():
+    player_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    players_per_game = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    poll_interval = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+    results_file = sys.argv[4] if len(sys.argv) > 4 else None
+    baseline_file = sys.argv[5] if len(sys.argv) > 5 and sys.argv[5] else None
+    team_count = int(sys.argv[6]) if len(sys.argv) > 6 else 2
+
+    configs = configparser.ConfigParser()
+    configs.read(configfile)
+    host = configs['CLIENT'].get('HOST_NAME', '127.0.0.1') if configs.has_section('CLIENT') else '127.0.0.1'
+    port = int(configs['CLIENT'].get('SERVER_PORT', '4230')) if configs.has_section('CLIENT') else 4230
+
+    summary, errors = run_load(host, port, player_count, players_per_game, poll_interval, team_count=team_count)
+    for error in errors[:10]:
+        print("Error: " + error)
+    baseline = None
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+    if results_file:
+        with open(results_file, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Locks - game and server locks that can be profiled, turned on with the server's LOCK_PROFILE setting
+# A profiled lock records, for each call site, how often it was acquired, how long callers waited for it and how
+# long they held it, so the locks serializing the server can be found with numbers instead of guesses
+# The call site is the function taking the lock and the function that called it, e.g. the cursor lock taken by
+# push_to_subscribers for a chat message is "push_to_subscribers < add_chat"
+import sys
+import threading
+import time
+
+profiling = False  # Locks made while this is False are plain threading locks with no overhead
+
+
+# Wait and hold times of every profiled lock, per call site
+class LockProfile():
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: (lock name, call site), value: [acquisitions, contended acquisitions, total wait, max wait,
+        # total hold, max hold] in seconds
+        self.sites = {}
+
+    def record(self, name, site, contended, waited, held):
+        with self.lock:
+            entry = self.sites.get((name, site))
+            if entry is None:
+                entry = self.sites[(name, site)] = [0, 0, 0.0, 0.0, 0.0, 0.0]
+            entry[0] += 1
+            if contended:
+                entry[1] += 1
+            entry[2] += waited
+            if waited > entry[3]:
+                entry[3] = waited
+            entry[4] += held
+            if held > entry[5]:
+                entry[5] = held
+
+    # Every call site with its times in milliseconds, the ones callers waited on longest in total first,
+    # then the ones held longest since they are what the others wait on once there is contention
+    def snapshot(self):
+        with self.lock:
+            sites = [(name, site, list(entry)) for (name, site), entry in self.sites.items()]
+        sites.sort(key=lambda site: (site[2][2], site[2][4]), reverse=True)
+        return [{"lock": name, "site": site, "count": count, "contended": contended, "wait_ms": wait * 1000,
+                 "max_wait_ms": max_wait * 1000, "hold_ms": hold * 1000, "max_hold_ms": max_hold * 1000}
+                for name, site, (count, contended, wait, max_wait, hold, max_hold) in sites]
+
+
+lock_profile = LockProfile()  # Shared by every profiled lock of the process
+
+
+# Drop-in for threading.Lock that records every acquisition in lock_profile
+class ProfiledLock():
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        # Set by the holder after acquiring, only read by the holder when releasing
+        self.site = None
+        self.contended = False
+        self.waited = 0.0
+        self.acquired_at = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self.acquire_at(call_site(), blocking, timeout)
+
+    def acquire_at(self, site, blocking=True, timeout=-1):
+        contended = not self.lock.acquire(False)
+        waited = 0.0
+        if contended:
+            if not blocking:
+                return False
+            start = time.perf_counter()
+            if not self.lock.acquire(True, timeout):
+                return False
+            waited = time.perf_counter() - start
+        self.site = site
+        self.contended = contended
+        self.waited = waited
+        self.acquired_at = time.perf_counter()
+        return True
+
+    # Recorded after releasing so the profile's own lock never adds to the hold time
+    def release(self):
+        held = time.perf_counter() - self.acquired_at
+        site, contended, waited = self.site, self.contended, self.waited
+        self.lock.release()
+        lock_profile.record(self.name, site, contended, waited, held)
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire_at(call_site())
+        return True
+
+    def __exit__(self, *args):
+        self.release()
+
+
+# Function taking the lock and its caller, as seen from acquire or __enter__
+def call_site():
+    frame = sys._getframe(2)
+    caller = frame.f_back
+    return frame.f_code.co_name + (" < " + caller.f_code.co_name if caller is not None else "")
+
+
+# A lock for the game or server state, profiled if profiling is on when it is made
+def make_lock(name):
+    return ProfiledLock(name) if profiling else threading.Lock()
+
+
+# Text table of the call sites waited on longest, one line per call site
+def format_profile(snapshot, top=10):
+    lines = ["lock / call site".ljust(52) + "     count  contended    wait ms   max wait    hold ms   max hold"]
+    for site in snapshot[:top]:
+        line = (site["lock"] + " " + site["site"]).ljust(52)[:52] + str(site["count"]).rjust(10) + \
+               str(site["contended"]).rjust(11)
+        for key in ("wait_ms", "max_wait_ms", "hold_ms", "max_hold_ms"):
+            line += format(site[key], ".3f").rjust(11)
+        lines.append(line)
+    return '\n'.join(lines)
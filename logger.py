@@ -0,0 +1,76 @@
+# Logger - buffered logging shared by the client and server
+# Records are queued by the caller and written to the console and log file by a background thread
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+
+levels = {"DEBUG": 10, "INFO": 20, "ERROR": 40}
+
+
+class ActionLogger():
+    def __init__(self, path, flush_interval=1.0, level="INFO"):
+        self.path = path
+        self.flush_interval = flush_interval  # Seconds written records may wait before the log file is flushed
+        self.level = levels[level.upper()]  # Records below this level are dropped by the caller
+        self.pid = None
+        self.start()
+        atexit.register(self.close)
+
+    # Open the log file and start the writer thread, run again in a forked process since threads are not copied
+    def start(self):
+        self.pid = os.getpid()
+        self.records = queue.Queue()
+        self.log_file = open(self.path, "at")
+        self.thread = threading.Thread(target=self.write_records, daemon=True)
+        self.thread.start()
+
+    def log(self, msg, level="INFO"):
+        if levels[level] < self.level:
+            return
+        if self.pid != os.getpid():
+            self.start()
+        self.records.put(msg)
+
+    # Writer thread, writes every queued record in one batch and flushes at most once per flush interval
+    def write_records(self):
+        last_flush = time.monotonic()
+        unflushed = False
+        while True:
+            try:
+                batch = [self.records.get(timeout=self.flush_interval if unflushed else None)]
+            except queue.Empty:  # Nothing new within the flush interval, flush what is waiting
+                self.flush()
+                last_flush = time.monotonic()
+                unflushed = False
+                continue
+            while True:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = None in batch
+            lines = ''.join(msg + '\n' for msg in batch if msg is not None)
+            sys.stdout.write(lines)
+            self.log_file.write(lines)
+            unflushed = True
+            if closing or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+                unflushed = False
+            if closing:
+                self.log_file.close()
+                return
+
+    def flush(self):
+        sys.stdout.flush()
+        self.log_file.flush()
+
+    # Write out every queued record and close the log file
+    def close(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.records.put(None)
+            self.thread.join()
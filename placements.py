@@ -0,0 +1,153 @@
+# Placements - index of every legal placement of each ship size on a board, shared by the client setup,
+# bots and simulations
+# Placement p of a size is horizontal for p < horizontal count, numbered row by row, then vertical
+# Each placement has its cell indexes and a bitmask of them, so overlap checks are a single AND
+import random
+from game import Game
+
+
+class PlacementIndex():
+    indexes = {}  # key: board size, value: placement index of that board size
+    mask_list_cells = 1024  # Random fleets on boards up to this many cells keep the mask of every placement
+
+    def __init__(self, size=10):
+        self.size = size
+        self.cell_count = size * size
+        # Built for each ship size on first use, random fleets and lookups never need them so large boards
+        # only pay for the lists their bots or simulations use
+        self.cell_lists = {}  # key: ship size, value: cell indexes of every placement
+        self.mask_lists = {}  # key: ship size, value: bitmask of every placement
+        self.covering_lists = {}  # key: ship size, value: placements covering each cell
+
+    # Placement index of a board size, built once per board size
+    @staticmethod
+    def get(size=10):
+        if size not in PlacementIndex.indexes:
+            PlacementIndex.indexes[size] = PlacementIndex(size)
+        return PlacementIndex.indexes[size]
+
+    def count(self, ship_size):
+        return 2 * self.size * (self.size - ship_size + 1)
+
+    # First cell of a placement and the step to its next cell (1 horizontal, board size vertical)
+    def start(self, ship_size, p):
+        n = self.size
+        horizontal = n * (n - ship_size + 1)
+        if p < horizontal:
+            row, col = divmod(p, n - ship_size + 1)
+            return row * n + col, 1
+        return p - horizontal, n  # Vertical placements are numbered by their first cell
+
+    def placement_cells(self, ship_size, p):
+        first, step = self.start(ship_size, p)
+        return tuple(range(first, first + ship_size * step, step))
+
+    def mask(self, ship_size, p):
+        first, step = self.start(ship_size, p)
+        return sum(1 << cell for cell in range(first, first + ship_size * step, step))
+
+    def cells(self, ship_size):
+        if ship_size not in self.cell_lists:
+            self.cell_lists[ship_size] = [self.placement_cells(ship_size, p) for p in range(self.count(ship_size))]
+        return self.cell_lists[ship_size]
+
+    def masks(self, ship_size):
+        if ship_size not in self.mask_lists:
+            self.mask_lists[ship_size] = [self.mask(ship_size, p) for p in range(self.count(ship_size))]
+        return self.mask_lists[ship_size]
+
+    def covering(self, ship_size):
+        if ship_size not in self.covering_lists:
+            covering = [[] for cell in range(self.cell_count)]
+            for p, cells in enumerate(self.cells(ship_size)):
+                for cell in cells:
+                    covering[cell].append(p)
+            self.covering_lists[ship_size] = covering
+        return self.covering_lists[ship_size]
+
+    # Placement with the given end cells (either order), None if they are not ship_size apart on a row or column
+    def find(self, ship_size, first, last):
+        n = self.size
+        first, last = min(first, last), max(first, last)
+        row, col = divmod(first, n)
+        if last - first == ship_size - 1 and last // n == row:
+            return row * (n - ship_size + 1) + col
+        if last - first == (ship_size - 1) * n and ship_size > 1:
+            return n * (n - ship_size + 1) + row * n + col
+        return None
+
+    # Placement covering exactly the given cell indexes in any order, None if they do not form one
+    def find_cells(self, ship_size, cells):
+        if len(cells) != ship_size:
+            return None
+        p = self.find(ship_size, min(cells), max(cells))
+        if p is None or sorted(cells) != list(self.placement_cells(ship_size, p)):
+            return None
+        return p
+
+    # Random non-overlapping placement of every ship of a fleet (dict of ship -> ship size, Game.ship_size
+    # by default), returns a dict of ship -> placement
+    def random_fleet(self, rng=random, ship_size=None):
+        taken = 0
+        fleet = {}
+        ship_size = ship_size or Game.ship_size
+        for ship in ship_size:
+            size = ship_size[ship]
+            count = self.count(size)
+            masks = self.masks(size) if self.cell_count <= PlacementIndex.mask_list_cells else None
+            while True:
+                p = rng.randrange(count)
+                mask = masks[p] if masks else self.mask(size, p)
+                if not mask & taken:
+                    break
+            taken |= mask
+            fleet[ship] = p
+        return fleet
+
+    def cell_coord(self, cell):
+        return str(cell // self.size + 1) + '_' + str(cell % self.size + 1)
+
+    def coord_cell(self, coord):
+        row, col = coord.split('_')
+        return (int(row) - 1) * self.size + int(col) - 1
+
+    # Check a whole fleet, a dict of ship -> ship coords ("row_col" strings), against the ship sizes of the game
+    # (Game.ship_size by default)
+    # Returns the error of the first problem found, None if every ship is on a legal placement of its own
+    def check_fleet(self, fleet, ship_size=None):
+        ship_size = ship_size or Game.ship_size
+        missing = [ship for ship in ship_size if ship not in fleet]
+        if missing:
+            return "missing " + " ".join(missing)
+        taken = 0
+        for ship in fleet:
+            if ship not in ship_size:
+                return "unknown ship " + ship
+            size = ship_size[ship]
+            cells = []
+            for coord in fleet[ship]:
+                row, _, col = coord.partition('_')
+                if not (row.isdecimal() and col.isdecimal() and 1 <= int(row) <= self.size and 1 <= int(col) <= self.size):
+                    return ship + " coordinate " + coord + " is not on the board"
+                cells.append((int(row) - 1) * self.size + int(col) - 1)
+            p = self.find_cells(size, cells)
+            if p is None:
+                return ship + " must cover " + str(size) + " cells in one row or column"
+            mask = self.mask(size, p)
+            if mask & taken:
+                return ship + " overlaps another ship"
+            taken |= mask
+        return None
+
+    # Ship coords ("row_col" strings) of a placement
+    def coords(self, ship_size, p):
+        return [self.cell_coord(cell) for cell in self.placement_cells(ship_size, p)]
+
+
+# Random fleet as a ship coords dict ("row_col" strings) with no overlapping ships
+# ship_size is the fleet to place, a dict of ship -> ship size (Game.ship_size by default)
+def random_fleet(rng=random, size=10, ship_size=None):
+    ship_size = ship_size or Game.ship_size
+    index = PlacementIndex.get(size)
+    fleet = index.random_fleet(rng, ship_size)
+    return {ship: index.coords(ship_size[ship], fleet[ship]) for ship in fleet}
@@ -1,99 +1,74 @@
 # Player - object represents an individual player
+from locks import make_lock
+from board import Board
 from game import Game
 
 class Player():
     c_state = {"Empty": '-', "Ship": 'S', "Hit": 'H', "Miss": 'M',  "Sunk": 'X'}
+    cell_codes = {'-': Board.EMPTY, 'S': Board.SHIP, 'H': Board.HIT, 'M': Board.MISS, 'X': Board.SUNK}
 
-    def __init__(self, username, team, player_num):
+    # board_size and ships are the game's, see Game.board_size and Game.ships
+    def __init__(self, username, team, player_num, board_size=10, ships=None):
         self.username = username
         self.team = team
         self.player_num = player_num
         self.is_alive = True  # Player alive or eliminated
-        self.taken_turn = False  # If this player has taken their turn yet
-        # 10x10 board for this player
-        self.grid = [[Player.c_state["Empty"] for i in range(11)] for j in range(11)]
-        # First row and column store coordinate axis values
-        self.grid[0][0] = '+'
-        for row in range(1, 11):
-            self.grid[row][0] = Game.rows[row]
-        for col in range(1, 11):
-            self.grid[0][col] = col
-        self.ship_coords = {"carrier": [], "battleship": [], "cruiser": [], "submarine": [], "destroyer": []}
+        self.moved_turn = 0  # Team turn this player last moved in, see Game.has_taken_turn
+        # Board for this player, coordinates start at 1
+        self.board = Board(board_size)
+        self.ship_coords = {ship: [] for ship in ships or Game.ships}
         # Ship state - True (Afloat), False (Sunk)
-        self.ship_state = {"carrier": True, "battleship": True, "cruiser": True, "submarine": True, "destroyer": True}
-        # Stores every message player needs to receive
-        self.chat_buffer = []
-        # Stores every state change notification player needs to receive
-        self.state_buffer = []
+        self.ship_state = {ship: True for ship in ships or Game.ships}
+        self.ships_afloat = len(self.ship_state)
+        # Number of game events (Game.events) and chat log entries (Game.chat_log) already read by the player
+        self.event_cursor = 0
+        self.chat_cursor = 0
+        self.board_lock = make_lock("board")  # Guards the grid and ship state
+        self.cursor_lock = make_lock("cursor")  # Guards the event and chat cursors
 
     def get_grid_coordinate(self, row, col):
-        return self.grid[row][col]
+        return chr(Board.cell_chars[self.board.get_cell(row, col)])
 
     def set_grid_coordinate(self, row, col, cell_state):
-        self.grid[row][col] = cell_state
+        self.board.set_cell(row, col, Player.cell_codes[cell_state])
 
+    # Text grid with the axis values in the first row and column
     def get_grid(self):
-            return '\n'.join(' '.join(str(cell) for cell in row) for row in self.grid)
+        return self.board.get_grid()
+
+    # Binary board update for a viewer holding the board at version since, see Board.encode_update
+    def get_board_update(self, since=None, hide_ships=False):
+        return self.board.encode_update(since, hide_ships)
 
     def get_ship_coordinates(self):
         return self.ship_coords
 
+    # Store the "row_col" coordinates of a ship and place it on the board
     def set_ship_coordinates(self, ship, coords):
         self.ship_coords[ship] = coords
+        self.board.place_ship(ship, [tuple(int(c) for c in coord.split('_')) for coord in coords])
 
     def set_move(self, row, col):
-        cell = self.get_grid_coordinate(row, col)
-        if cell == Player.c_state["Ship"]:  # Hit the ship
-            self.set_grid_coordinate(row, col, Player.c_state["Hit"])
+        if self.board.shoot(row, col) == Board.HIT:  # Hit the ship
             return "HIT"
         else:  # Miss the ship
-            self.set_grid_coordinate(row, col, Player.c_state["Miss"])
             return "MISS"
 
-    # Updates the current state of each ship
+    # Updates the state of the ship hit by the last move, only that ship can have been sunk by it
     def update_ship_state(self, attacker):
-        for ship in self.ship_coords:
-            # Check through every afloat ship
-            if self.ship_state[ship]:
-                is_sunk = True
-                for coord in self.ship_coords[ship]:
-                    coordinates = coord.split('_')
-                    cell = self.get_grid_coordinate(int(coordinates[0]), int(coordinates[1]))
-                    if cell != Player.c_state["Hit"]:
-                        is_sunk = False
-                        break
-                if is_sunk:
-                    for coord in self.ship_coords[ship]:
-                        coordinates = coord.split('_')
-                        self.set_grid_coordinate(int(coordinates[0]), int(coordinates[1]), Player.c_state["Sunk"])
-                    self.ship_state[ship] = False
-                    return "SUNK " + attacker.username + ' ' + self.username + ' ' + ship + ' ' + \
-                           ' '.join(self.ship_coords[ship])
+        ship = self.board.last_hit_ship
+        if ship is not None and self.ship_state.get(ship) and self.board.is_sunk(ship):
+            self.board.sink_ship(ship)
+            self.ship_state[ship] = False
+            self.ships_afloat -= 1
+            return "SUNK " + attacker.username + ' ' + self.username + ' ' + ship + ' ' + \
+                   ' '.join(self.ship_coords[ship])
         return "NO_CHANGE"
 
     # Returns True if player has no more ships or False otherwise
     def check_if_dead(self):
-        for ship in self.ship_state:
-            if self.ship_state[ship]:
-                return False  # Afloat ship found
+        if self.ships_afloat > 0:
+            return False  # Afloat ship found
         # All ships sunk
         self.is_alive = False
         return True
-
-    def add_chat_message(self, msg):
-        self.chat_buffer.append(msg)
-
-    def get_chat_messages(self):
-        return self.chat_buffer
-
-    def clear_chat_messages(self):
-        self.chat_buffer = []
-
-    def add_state(self, msg):
-        self.state_buffer.append(msg)
-
-    def get_state_buffer(self):
-        return self.state_buffer
-
-    def clear_state_buffer(self):
-        self.state_buffer = []
\ No newline at end of file
@@ -0,0 +1,82 @@
+# Protocol - length prefixed message framing shared by the client and server
+# Every message on a TCP connection is a 4 byte big-endian payload length followed by the payload
+import struct
+
+header = struct.Struct('!I')
+max_message_size = 64 * 1024 * 1024  # Refuse larger messages, a bad header would otherwise allocate without limit
+
+
+# Frame a message, text messages are encoded as UTF-8
+def encode_message(msg):
+    if isinstance(msg, str):
+        msg = msg.encode()
+    return header.pack(len(msg)) + msg
+
+
+# Returns the payload length stored in a message header
+def decode_header(header_bytes):
+    size = header.unpack(header_bytes)[0]
+    if size > max_message_size:
+        raise ConnectionError("message of " + str(size) + " bytes exceeds the maximum message size")
+    return size
+
+
+# Returns the number of bytes sent, header included
+def send_message(sock, msg):
+    data = encode_message(msg)
+    sock.sendall(data)
+    return len(data)
+
+
+# Send several messages with one system call, the receiver reads them back one at a time
+def send_messages(sock, msg_list):
+    data = b''.join(encode_message(msg) for msg in msg_list)
+    sock.sendall(data)
+    return len(data)
+
+
+# Receive exactly size bytes, raises ConnectionError if the connection closes first
+def recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+# Receive one message as bytes
+def recv_message_bytes(sock):
+    return recv_exactly(sock, decode_header(recv_exactly(sock, header.size)))
+
+
+# Receive one text message
+def recv_message(sock):
+    return recv_message_bytes(sock).decode()
+
+
+# Event loop counterparts of the socket functions above, for asyncio stream readers and writers
+def write_message(writer, msg):
+    data = encode_message(msg)
+    writer.write(data)
+    return len(data)
+
+
+def write_messages(writer, msg_list):
+    data = b''.join(encode_message(msg) for msg in msg_list)
+    writer.write(data)
+    return len(data)
+
+
+async def read_message_bytes(reader):
+    try:
+        size = decode_header(await reader.readexactly(header.size))
+        return await reader.readexactly(size)
+    except EOFError:  # asyncio.IncompleteReadError
+        raise ConnectionError("connection closed")
+
+
+async def read_message(reader):
+    return (await read_message_bytes(reader)).decode()
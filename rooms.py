@@ -0,0 +1,90 @@
+# Rooms - keeps track of every game hosted by the server, keyed by room id
+from locks import make_lock
+from game import Game
+
+
+class Room():
+    def __init__(self, room_id, player_count, board_size=10, fleet=None):
+        self.room_id = room_id
+        self.game = Game(player_count, board_size, fleet)
+        self.connection_count = 0  # Connections currently routed to this room
+
+
+class RoomManager():
+    def __init__(self, player_count, max_rooms, bot_count=0, board_size=10, fleet=None):
+        self.player_count = player_count  # Players needed to start a game in each room
+        self.bot_count = bot_count  # Players of each room that are bots, the other seats are for connections
+        self.board_size = board_size  # Board size and fleet (dict of ship -> ship size) of every game
+        self.fleet = fleet
+        self.max_rooms = max_rooms
+        self.rooms = {}  # key: room id, value: room object
+        self.lock = make_lock("rooms")
+        self.auto_room_num = 0  # Used to name rooms created for players that did not ask for a room
+        self.open_room = None  # Room id new players without a room choice are sent to
+        self.room_listeners = []  # Functions called with every newly created room
+        self.vacant_rooms = []  # Automatic rooms a player left before the game was set up, filled first
+        self.vacancy_listeners = []  # Functions called with the room whenever a player gives back their seat
+
+    def add_room_listener(self, listener):
+        self.room_listeners.append(listener)
+
+    def add_vacancy_listener(self, listener):
+        self.vacancy_listeners.append(listener)
+
+    def get_room(self, room_id):
+        return self.rooms.get(room_id)
+
+    # Route a joining connection to a room and assign it a player number in that room
+    # An empty room id picks a room still waiting for players, returns (room, player num) or (None, None) if full
+    def join(self, room_id=None):
+        with self.lock:
+            if not room_id:
+                while self.vacant_rooms and not self.room_has_space(self.rooms.get(self.vacant_rooms[0])):
+                    self.vacant_rooms.pop(0)
+                room_id = self.vacant_rooms.pop(0) if self.vacant_rooms else self.open_room
+                if room_id is None or not self.room_has_space(self.rooms.get(room_id)):
+                    self.auto_room_num += 1
+                    room_id = "auto-" + str(self.auto_room_num)
+                    self.open_room = room_id
+
+            room = self.rooms.get(room_id)
+            if room is None:
+                if len(self.rooms) >= self.max_rooms:
+                    return None, None
+                room = Room(room_id, self.player_count, self.board_size, self.fleet)
+                self.rooms[room_id] = room
+                for listener in self.room_listeners:
+                    listener(room)
+            elif not self.room_has_space(room):
+                return None, None
+
+            room.connection_count += 1
+            return room, room.game.assign_player_num()
+
+    # Detach a connection from its room, the room is recycled once every connection has left
+    # A player leaving before the game is set up gives back their seat, so another player can take it
+    # Returns True if the room was removed
+    def leave(self, room, player_num=None):
+        with self.lock:
+            room.connection_count -= 1
+            if player_num is not None:
+                with room.game.lock:  # Joins are counted under the game lock
+                    seat_freed = not room.game.game_setup
+                    if seat_freed:
+                        room.game.remove_player(player_num)
+                if seat_freed:
+                    if room.room_id.startswith("auto-") and room.room_id != self.open_room:
+                        self.vacant_rooms.append(room.room_id)
+                    for listener in self.vacancy_listeners:
+                        listener(room)
+            if room.connection_count <= 0:
+                if self.rooms.get(room.room_id) is room:
+                    del self.rooms[room.room_id]
+                if self.open_room == room.room_id:
+                    self.open_room = None
+                return True
+            return False
+
+    def room_has_space(self, room):
+        return room is not None and room.game.seats_taken() < self.player_count - self.bot_count and \
+               not room.game.game_setup
@@ -5,34 +5,69 @@ import sys
 import os
 import configparser
 import json
+import asyncio
+import queue
+import multiprocessing
+import time
+import protocol
+import sharding
+import bots
+import locks
+from logger import ActionLogger
 from player import Player
 from game import Game
+from board import Board
+from rooms import RoomManager
+from placements import PlacementIndex
+from stats import CommandStats, format_snapshot
 
 # Globals
-thread_list = []
 hostname = None
 server_port = None
-chat_port_min = None
+push_port = None  # Port clients subscribe on to have game events pushed to them
 configfile = 'server\conf\server.cfg'
 configs = None
 logfile = None
-max_players = None
+log_level = None  # Lowest level written to the log, DEBUG also logs every command served
+log_flush_interval = None  # Seconds logged records may wait before the log file is flushed
+action_logger = None  # Writes print_action records from a background thread
+max_players = None  # Players per game
+bot_players = None  # Computer players in each game, added once the other players have joined
+max_rooms = None  # Games hosted at the same time
 users = {}
 root = ""
-recv_buffer = None
+server_mode = None  # THREAD (one thread per connection) or ASYNC (single event loop)
+listen_backlog = None
+phase_wait = None  # Seconds a waiting client's request is held open for a phase change
+worker_processes = None  # Worker processes rooms are sharded across, 0 serves everything in this process
+handshake_timeout = None  # Seconds the acceptor waits for a connection's first request before handing it off
 
-game = None  # Holds the current game state
+room_manager = None  # Holds the game state of every room
+board_size = None  # Rows and columns of every board
+fleet = None  # Ships every player places, dict of ship -> ship size in placement order
+placement_index = None  # Legal placements submitted fleets are checked against
+stats_interval = None  # Seconds between dumps of the request stats to the log, 0 to only answer STATS queries
+stat_commands = {"UPDATE_GAME", "UPDATE_CHAT", "NEW_BOARD", "MOVE", "CHAT", "END_GAME"}  # Counted by name
+command_stats = CommandStats()  # Requests served by run_cmds in this process
+phase_stats = CommandStats()  # Time connections spend in each phase of client_thread in this process
+stats_label = "server"  # Process the stats belong to, "worker N" in worker processes
 
-game_lock = threading.Lock()  # Lock for processing game state
-log_lock = threading.Lock()  # Lock for writing to logfile
 
 abort_game = False
+workers = []  # (process, pipe, pipe lock) of every worker process (acceptor process only)
+auto_room_lock = None  # Guards the automatic room assignment (acceptor process only)
+auto_room_num = 1  # Room players without a room choice are currently sent to (acceptor process only)
+auto_room_joins = 0
+auto_room_vacancies = []  # Automatic rooms given a player whose handoff failed, filled before any other room
+async_clients = {}  # key: client task, value: its stream writer (ASYNC mode)
 
 
 # Setup the server using the configuration file
 def configure():
-    global hostname, server_port, chat_port_min, configfile, configs, logfile, max_players, recv_buffer, \
-           game, player_ready_count
+    global hostname, server_port, configfile, configs, logfile, max_players, bot_players, \
+           room_manager, max_rooms, server_mode, listen_backlog, phase_wait, push_port, worker_processes, \
+           handshake_timeout, log_level, log_flush_interval, stats_interval, auto_room_lock, board_size, fleet, \
+           placement_index
 
     configfile = get_pathname(configfile)
     # Retrieve default settings from configuration file, store into configs dict
@@ -44,21 +79,45 @@ def configure():
 
     hostname = configs['SERVER']['HOST_NAME']
     server_port = int(configs['SERVER']['SERVER_PORT'])
-    chat_port_min = int(configs['SERVER']['CHAT_PORT_MIN'])
+    push_port = int(configs['SERVER'].get('PUSH_PORT', '0'))
 
     logfile = get_pathname(configs['SERVER']['PATH_LOG'])
     if not os.path.exists(logfile):
         print("Error: Could not find log file. Exiting...")
         sys.exit(1)
+    log_level = configs['SERVER'].get('LOG_LEVEL', 'INFO').upper()
+    log_flush_interval = float(configs['SERVER'].get('LOG_FLUSH_INTERVAL', '1'))
+    stats_interval = float(configs['SERVER'].get('STATS_INTERVAL', '0'))
+    # Locks made from here on record their wait and hold times per call site
+    locks.profiling = configs['SERVER'].getboolean('LOCK_PROFILE', False)
+    auto_room_lock = locks.make_lock("auto room")
 
     max_players = int(configs['SERVER']['MAX_PLAYERS'])
-    recv_buffer = int(configs['SERVER']['RECV_BUFFER'])
-    # Initialize Game state
-    game = Game(max_players)
+    bot_players = min(int(configs['SERVER'].get('BOT_PLAYERS', '0')), max_players - 1)  # Leave a seat for a player
+    max_rooms = int(configs['SERVER'].get('MAX_ROOMS', '1'))
+    board_size = int(configs['SERVER'].get('BOARD_SIZE', '10'))
+    fleet = parse_fleet(configs['SERVER'].get('FLEET', ''), board_size)
+    if not 2 <= board_size <= Board.max_size or fleet is None:
+        print("Error: BOARD_SIZE must be 2 to " + str(Board.max_size) + " and FLEET must fit on half the board. "
+              "Exiting...")
+        sys.exit(1)
+    if bot_players > 0 and board_size > bots.max_board_size:
+        print("Error: BOT_PLAYERS needs a BOARD_SIZE of at most " + str(bots.max_board_size) + ". Exiting...")
+        sys.exit(1)
+    placement_index = PlacementIndex.get(board_size)
+    if bot_players > 0:  # Build the bots' blank target map now rather than on a bot's first move
+        bots.new_map(board_size, fleet)
+    server_mode = configs['SERVER'].get('SERVER_MODE', 'THREAD').upper()
+    listen_backlog = int(configs['SERVER'].get('LISTEN_BACKLOG', '5'))
+    phase_wait = float(configs['SERVER'].get('PHASE_WAIT', '0.5'))
+    worker_processes = int(configs['SERVER'].get('WORKER_PROCESSES', '0'))
+    handshake_timeout = float(configs['SERVER'].get('HANDSHAKE_TIMEOUT', '30'))
+    # Initialize the rooms holding each game state
+    room_manager = RoomManager(max_players, max_rooms, bot_players, board_size, fleet)
+    room_manager.add_room_listener(log_new_room)
 
 
 def main():
-    global thread_list, game, abort_game
     # Configure the program based on configuration file
     configure()
 
@@ -67,270 +126,847 @@ def main():
     f_log.write('Starting the Battleship Server\n')
     f_log.close()
 
+    if worker_processes > 0:  # Each worker keeps the stats of the requests it serves
+        sharded_main()
+        sys.exit(0)
+    start_logger()
+    start_stats_dump()
+    if server_mode == "ASYNC":
+        async_main()
+        sys.exit(0)
+
     # Create Server Socket (TCP)
     server_socket = socket(AF_INET, SOCK_STREAM)
     server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
     server_socket.bind((hostname, server_port))
-    server_socket.listen(5)
+    server_socket.listen(listen_backlog)
     print_action('The Battleship Server is ready')
 
-    # Receiving TCP connection from players
-    while not threading.active_count() - 1 == max_players:
-        try:
+    # Accept push subscriptions in the background
+    if push_port:
+        threading.Thread(target=push_listener, daemon=True).start()
+
+    # Receiving TCP connection from players, each one is routed to a room when the player joins
+    try:
+        while True:
             connection_socket, addr = server_socket.accept()
-            # Check if at the maximum connection limit
-            if threading.active_count() - 1 <= max_players:
-                # Assign a player number to this player
-                player_num = game.assign_player_num()
-                # Send Confirmation Message and player num
-                connection_socket.send(('SRDY ' + str(player_num)).encode())
-                print_action('Sent: SRDY ' + str(player_num))
-
-                print_action("*** Thread client entering now for: " + str(addr) + " ***")
-
-                # Create and start thread for player
-                t = threading.Thread(target=client_thread, args=(connection_socket, addr, player_num))
-                t.start()
-                thread_list.append(t)
-            else:
-                # Send Error message
-                connection_socket.send('BUSY Battleship game is full, please try again later'.encode())
-                print_action('Sent: BUSY Battleship game is full, please try again later')
-        except OSError as e:
-            print_action("Socket error: " + str(e))
-            sys.exit(1)
-
-    # Check if game is ready to launch
-    while not game.game_setup:
-        game_lock.acquire()
-        if game.player_join_count == max_players:
-            if game.enough_teams():
-                print_action("Teams ready, Going to game setup")
-                game.game_setup = True
-            else:
-                print_action("Not enough teams, cancelling game")
-                # TODO: RESET TEAM OPTION
-                sys.exit(1)
-        game_lock.release()
-
-    # Wait until everyone has finished entering their ship coordinates
-    while not game.game_start:
-        game_lock.acquire()
-        if game.player_ready_count == max_players:
-            print_action("Game setup complete, beginning game")
-            game.game_start = True
-            # Randomly designate first team
-            game.select_first_team()
-        game_lock.release()
-
-    # Keep game going until game terminates
-    while not game.game_end:
-        pass
+            print_action("*** Thread client entering now for: " + str(addr) + " ***")
 
-    print_action("The game has ended.\nThe winning team is: " + game.team_winner)
+            # Create and start thread for player
+            t = threading.Thread(target=client_thread, args=(connection_socket, addr), daemon=True)
+            t.start()
+    except OSError as e:
+        print_action("Socket error: " + str(e), "ERROR")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
 
     # Close server socket
     server_socket.close()
-    for t in thread_list:
-        t.join()
     print_action("Closing the Battleship Server")
     sys.exit(0)
 
 
-def client_thread(connection_socket, addr, player_num):
-    global game
-    # Get username and team choice, send designated player number
-    # Wait for game to enter setup phase
-    while True:
-        msg_tokens = connection_socket.recv(recv_buffer).decode().split()
-        username = msg_tokens[1]
-        team = msg_tokens[2]
+# first_msg is the JOIN request already read by the acceptor process when connections are sharded
+def client_thread(connection_socket, addr, first_msg=None):
+    room = None
+    phase = "JOIN"  # Phase of the connection, the time spent in each one is counted in phase_stats
+    phase_start = time.perf_counter()
+    try:
+        if first_msg is None:
+            # Send Confirmation Message
+            protocol.send_message(connection_socket, 'SRDY')
+            print_action('Sent: SRDY', "DEBUG")
 
-        game_lock.acquire()
-        if game.player_join_count < max_players:
-            if player_num not in list(game.players.keys()):
-                game.add_player(Player(username, team, player_num), player_num)
-                game.add_team(team, player_num)
-                game.player_join_count += 1
-        game_lock.release()
+        # Get username, team choice and room, send designated player number
+        # Wait for game to enter setup phase
+        while True:
+            if first_msg is not None:
+                msg_tokens = first_msg.split()
+                first_msg = None
+            else:
+                msg_tokens = protocol.recv_message(connection_socket).split()
+            if msg_tokens and msg_tokens[0] == "STATS" and room is None:
+                protocol.send_message(connection_socket, get_stats_reply(addr, connection_socket.getsockname()))
+                phase = None
+                return
+            if len(msg_tokens) < 3 or msg_tokens[0] != "JOIN":
+                raise ConnectionError("bad join request")
+            if room is None:
+                room, player_num = route_player(msg_tokens)
+                if room is None:
+                    # Send Error message
+                    protocol.send_message(connection_socket, 'BUSY Battleship room is full, please try again later')
+                    print_action('Sent: BUSY Battleship room is full, please try again later')
+                    return
+                game = room.game
+            join_player(game, player_num, msg_tokens[1], msg_tokens[2])
 
-        if game.game_setup:
-            # Notify client game setup phase has started
-            connection_socket.send("OK".encode())
-            break
-        else:
-            connection_socket.send("WAIT".encode())
+            game.wait_for_phase("SETUP", phase_wait)
+            if game.cancelled:
+                protocol.send_message(connection_socket, "CANCEL")
+                return
+            elif game.game_setup:
+                # Notify client game setup phase has started
+                # The board size and fleet to place follow on the second line
+                protocol.send_message(connection_socket, "OK " + str(player_num) + ' ' + room.room_id + '\n' +
+                                      get_rules_json(game))
+                break
+            else:
+                protocol.send_message(connection_socket, "WAIT " + str(player_num) + ' ' + room.room_id)
 
-    # Receive ship locations from player
-    process_coordinates(connection_socket, player_num)
-    game_lock.acquire()
-    game.player_ready_count += 1
-    game_lock.release()
+        phase, phase_start = "FLEET", record_phase(phase, phase_start)
+        # Receive ship locations from player
+        process_coordinates(connection_socket, game, player_num)
+        set_player_ready(game)
+        phase, phase_start = "START", record_phase(phase, phase_start)
 
-    # Wait for game to start
-    while True:
-        msg_tokens = connection_socket.recv(recv_buffer).decode().split()
-        if game.game_start:
-            # Notify client game start phase has started
-            connection_socket.send("OK".encode())
-            break
+        # Wait for game to start
+        while True:
+            msg_tokens = protocol.recv_message(connection_socket).split()
+            if game.wait_for_phase("PLAY", phase_wait):
+                # Notify client game start phase has started
+                protocol.send_message(connection_socket, "OK")
+                break
+            else:
+                protocol.send_message(connection_socket, "WAIT")
+        phase, phase_start = "SEND INFO", record_phase(phase, phase_start)
+
+        # Send to client the players, teams, and their initial board states
+        send_msg = protocol.recv_message(connection_socket)
+        if send_msg == "SEND INFO":
+            protocol.send_message(connection_socket, get_initial_game_state(game, player_num))
         else:
-            connection_socket.send("WAIT".encode())
+            print_action("Error: Bad request for game information", "ERROR")
+            return
+        phase, phase_start = "PLAY", record_phase(phase, phase_start)
 
-    # Send to client the players, teams, and their initial board states
-    send_msg = connection_socket.recv(recv_buffer).decode()
-    if send_msg == "SEND INFO":
-        send_initial_game_state(connection_socket, player_num)
-    else:
+        while not game.all_players_ended():
+            # Receive requests from client and respond to them
+            if not run_cmds(connection_socket, addr, game, player_num):
+                break
+    except OSError as e:  # Includes ConnectionError once the client disconnects
+        print_action("Connection error for " + str(addr) + ": " + str(e), "ERROR")
+    finally:
+        print_action("*** Thread closed for: " + str(addr) + " ***")
+        if phase is not None:  # The phase the connection ended in, by the game ending or a disconnect
+            record_phase(phase, phase_start)
+        if room is not None:
+            leave_room(room, player_num)
+        # Close control socket
         connection_socket.close()
-        print_action("Error: Bad request for game information")
-        sys.exit(1)
 
-    while game.player_end_count < max_players:
-        # Receive requests from client and respond to them
-        run_cmds(connection_socket, addr, player_num)
 
-    print_action("*** Thread closed for: " + str(addr) + " ***")
-    # Close control socket
-    connection_socket.close()
+# Receive and execute action commands from player, returns False once the client has disconnected
+def run_cmds(connection_socket, addr, game, player_num):
+    try:
+        cmd_bytes = protocol.recv_message_bytes(connection_socket)
+    except ConnectionError:  # Clients close the connection between requests once they are done
+        return False
+    start = time.perf_counter()  # Time spent serving the request, waiting for it is not counted
+    tokens, replies = serve_command(game, player_num, cmd_bytes)
+    sent = protocol.send_messages(connection_socket, replies)
+    record_command(tokens, start, len(cmd_bytes) + protocol.header.size, sent)
+    return True
 
 
-# Receive and execute action commands from player
-def run_cmds(connection_socket, addr, player_num):
-    global game
+# Serve one request made during the game, the same for every server mode
+# Returns the request tokens and the reply messages, which are sent back together
+def serve_command(game, player_num, cmd_bytes):
     player = game.get_player(player_num)
+    # A CHAT command carries its message after the first line of the request
+    cmd_line, _, chat_msg = cmd_bytes.decode().partition('\n')
+    tokens = cmd_line.split()
 
-    cmd_msg = connection_socket.recv(recv_buffer).decode()
-    tokens = cmd_msg.split()
-
-    if tokens[0] == "UPDATE_GAME":
+    if not tokens:
+        replies = ["UNKNOWN CODE"]
+    elif tokens[0] == "UPDATE_GAME" and not cursor_valid(tokens):
+        replies = ["UNKNOWN CODE"]
+    elif tokens[0] == "UPDATE_GAME":  # Optionally with the number of game events the client already has
         # Check if game state for player needs to be sent
-        state_list = player.get_state_buffer()
+        state_list = game.read_events(player_num, int(tokens[1]) if len(tokens) > 1 else None)
         if state_list:
-            connection_socket.send("UPDATE".encode())
-            ok_msg = connection_socket.recv(recv_buffer).decode()
-            connection_socket.send(('\n'.join(state_list)).encode())
-            print_action('Sent state messages to: ' + str(player_num))
-
-            game_lock.acquire()
-            player.clear_state_buffer()  # Clear the state buffer
-            game_lock.release()
+            # The notification and the state messages go out together
+            replies = ["UPDATE", '\n'.join(state_list)]
+            print_action('Sent state messages to: ' + str(player_num), "DEBUG")
         else:
-            connection_socket.send("GAME OK".encode())
+            replies = ["GAME OK"]
 
-    elif tokens[0] == "UPDATE_CHAT":
+    elif tokens[0] == "UPDATE_CHAT" and not cursor_valid(tokens):
+        replies = ["UNKNOWN CODE"]
+    elif tokens[0] == "UPDATE_CHAT":  # Optionally with the number of chat messages the client already has
         # Check if chat messages need to be sent
-        chat_list = player.get_chat_messages()
+        chat_list = game.read_chat(player_num, int(tokens[1]) if len(tokens) > 1 else None)
         if chat_list:
-            connection_socket.send("UPDATE".encode())
-            client_addr = connection_socket.recv(recv_buffer).decode()  # Wait for chat socket to be created
-            # setup chat connection (UDP) and send over the chat messages
-            try:
-                chat_socket = socket(AF_INET, SOCK_DGRAM)
-                for chat_msg in chat_list:  # send messages to the server socket
-                    chat_socket.sendto(chat_msg.encode(), (client_addr, chat_port_min + player_num))
-                chat_socket.sendto("SEND COMPLETE".encode(), (client_addr, chat_port_min + player_num))
-                chat_socket.close()
-            except OSError as e:
-                connection_socket.close()
-                print_action("Socket error: " + str(e))
-                sys.exit(1)
-
-            connection_socket.send("OK".encode())
-            print_action("Sent chat messages to: " + str(player_num))
-
-            game_lock.acquire()
-            player.clear_chat_messages()
-            game_lock.release()
+            # The notification and every waiting chat message go out together
+            replies = ["UPDATE", json.dumps(chat_list)]
+            print_action("Sent chat messages to: " + str(player_num), "DEBUG")
         else:  # Chat buffer empty, no changes need to be made
-            connection_socket.send("CHAT OK".encode())
+            replies = ["CHAT OK"]
 
-    elif tokens[0] == "NEW_BOARD":  # Requesting for updating other board
+    elif tokens[0] == "NEW_BOARD" and not board_request_valid(game, player, tokens):
+        replies = ["UNKNOWN CODE"]
+    elif tokens[0] == "NEW_BOARD":  # Requesting for updating other board, optionally since a board version
         other_num = int(tokens[1])
-        if tokens[2] == "ALLY":
-            connection_socket.send((game.players[other_num].get_grid()).encode())
-            ship_msg = connection_socket.recv(recv_buffer).decode()
-            # Serialize the ship coordinates into JSON string
-            json_string = json.dumps(game.players[other_num].get_ship_coordinates())  # Data serialized
-            connection_socket.send(json_string.encode())
-        elif tokens[2] == "ENEMY":
-            connection_socket.send((game.players[other_num].get_grid()).encode())
-        print_action("Sent new board to: " + str(player_num))
+        since = int(tokens[3]) if len(tokens) > 3 else None
+        replies = [get_board_update(game, other_num, since, tokens[2] == "ENEMY")]
+        if tokens[2] == "ALLY" and since is None:  # Allies get the ship coordinates right after their first board
+            replies.append(get_ship_coordinates_json(game, other_num))
+        print_action("Sent new board to: " + str(player_num), "DEBUG")
 
     elif tokens[0] == "MOVE":  # Entering a move
-        defender = game.get_player(int(tokens[1]))
-        row = int(tokens[2])
-        col = int(tokens[3])
-        # Verify if it's this player's turn and both players are alive
-        if player.team == game.team_turn and not player.taken_turn and player.is_alive and defender.is_alive:
-            game_lock.acquire()
-            game.make_move(player, defender, row, col)
-            game_lock.release()
-            print_action("Received move from: " + str(player_num) + ": " + tokens[1] + ' ' +
-                         tokens[2] +'_' + tokens[3])
-            connection_socket.send("MOVE_OK".encode())
-        elif not player.is_alive:
-            connection_socket.send("YOU_ARE_DEAD".encode())
-        elif not defender.is_alive:
-            connection_socket.send("ENEMY_IS_DEAD".encode())
-        elif player.taken_turn and player.team == game.team_turn:
-            connection_socket.send("ALREADY_TAKEN_TURN".encode())
-        else:
-            connection_socket.send("NOT_YOUR_TURN".encode())
+        replies = [process_move(game, player, tokens)]
 
     elif tokens[0] == "CHAT":  # Entering a chat message
-        # Create UDP socket
+        deliver_chat(game, player, tokens, chat_msg)
+        replies = ["CHAT OK"]
+
+    elif tokens[0] == "END_GAME":
+        end_player_game(game)
+        replies = ["OK"]
+    else:
+        replies = ["UNKNOWN CODE"]  # Can't identify code
+    return tokens, replies
+
+
+# Run as the acceptor of a pool of worker processes, every room lives in exactly one worker
+# The acceptor reads the first request of each connection to learn its room, then hands the socket off
+# Every worker is forked before the acceptor starts any thread, a thread holding a lock while a worker is
+# forked would leave that lock held for good in the worker
+def sharded_main():
+    vacancy_conns = []
+    for worker_num in range(worker_processes):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        vacancy_recv, vacancy_send = multiprocessing.Pipe(duplex=False)  # Seats given back in the worker's rooms
+        process = multiprocessing.Process(target=worker_main, args=(worker_num, child_conn, vacancy_send),
+                                          daemon=True)
+        process.start()
+        workers.append((process, parent_conn, threading.Lock()))
+        vacancy_conns.append(vacancy_recv)
+    start_logger()
+    for vacancy_recv in vacancy_conns:
+        threading.Thread(target=receive_vacancies, args=(vacancy_recv,), daemon=True).start()
+
+    server_socket = socket(AF_INET, SOCK_STREAM)
+    server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    server_socket.bind((hostname, server_port))
+    server_socket.listen(listen_backlog)
+    if push_port:
+        threading.Thread(target=accept_for_workers, args=(hostname, push_port, "PUSH"), daemon=True).start()
+    print_action('The Battleship Server is ready (' + str(worker_processes) + ' worker processes)')
+
+    try:
+        accept_for_workers(hostname, server_port, "CONTROL", server_socket)
+    except KeyboardInterrupt:
+        pass
+    server_socket.close()
+    print_action("Closing the Battleship Server")
+
+
+# Accept connections and start a short lived thread handing each one to its worker
+def accept_for_workers(host, port, kind, listen_socket=None):
+    if listen_socket is None:
+        listen_socket = socket(AF_INET, SOCK_STREAM)
+        listen_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        listen_socket.bind((host, port))
+        listen_socket.listen(listen_backlog)
+    while True:
+        connection_socket, addr = listen_socket.accept()
+        threading.Thread(target=handoff_connection, args=(connection_socket, addr, kind), daemon=True).start()
+
+
+# Read the first request of a connection and pass the socket to the worker owning the requested room
+def handoff_connection(connection_socket, addr, kind):
+    auto_room = None  # Automatic room counted for this connection, given back if the handoff fails
+    try:
+        connection_socket.settimeout(handshake_timeout)
+        if kind == "CONTROL":
+            protocol.send_message(connection_socket, 'SRDY')
+            first_msg = protocol.recv_message(connection_socket)
+            msg_tokens = first_msg.split()
+            if msg_tokens and msg_tokens[0] == "STATS":  # "STATS [worker num]", answered by that worker
+                worker_num = int(msg_tokens[1]) if len(msg_tokens) > 1 and msg_tokens[1].isdigit() else 0
+                worker_num = min(worker_num, len(workers) - 1)
+                room_id = None
+            elif len(msg_tokens) < 3 or msg_tokens[0] != "JOIN":
+                raise ConnectionError("bad join request")
+            else:
+                if len(msg_tokens) == 3:  # No room chosen, name the room here so it maps to a single worker
+                    auto_room = assign_auto_room()
+                    msg_tokens.append(auto_room)
+                    first_msg = ' '.join(msg_tokens)
+                room_id = msg_tokens[3]
+        else:  # "SUBSCRIBE <room id> <player num>"
+            first_msg = protocol.recv_message(connection_socket)
+            msg_tokens = first_msg.split()
+            room_id = msg_tokens[1] if len(msg_tokens) > 1 else ""
+        connection_socket.settimeout(None)
+
+        if room_id is not None:
+            worker_num = sharding.shard_for_room(room_id, len(workers))
+        process, conn, conn_lock = workers[worker_num]
+        with conn_lock:
+            sharding.send_connection(conn, process.pid, connection_socket, (kind, addr, first_msg))
+        auto_room = None
+        print_action("Handed " + str(addr) + " (room " + str(room_id) + ") to worker " + str(worker_num), "DEBUG")
+    except OSError as e:  # Includes ConnectionError
+        print_action("Connection error for " + str(addr) + ": " + str(e), "ERROR")
+        if auto_room is not None:  # The player never reached the room, the next player takes their place
+            release_auto_room(auto_room)
+    finally:
+        connection_socket.close()  # The worker holds its own copy of the socket
+
+
+# Name of the automatic room for the next player that did not choose one
+def assign_auto_room():
+    global auto_room_num, auto_room_joins
+    with auto_room_lock:
+        if auto_room_vacancies:
+            return auto_room_vacancies.pop(0)
+        if auto_room_joins >= max_players - bot_players:
+            auto_room_num += 1
+            auto_room_joins = 0
+        auto_room_joins += 1
+        return "auto-" + str(auto_room_num)
+
+
+# Take back the automatic room seats given up by players that left a worker's room before the game was set up
+def receive_vacancies(conn):
+    while True:
+        try:
+            room_id = conn.recv()
+        except (EOFError, OSError):
+            return
+        if room_id.startswith("auto-"):
+            release_auto_room(room_id)
+
+
+# Give back a player counted for an automatic room who never reached it
+def release_auto_room(room_id):
+    with auto_room_lock:
+        auto_room_vacancies.append(room_id)
+
+
+# Serve the connections handed over by the acceptor, in the configured SERVER_MODE
+def worker_main(worker_num, conn, vacancy_conn):
+    if configs is None:  # Workers started with spawn instead of fork have not read the configuration yet
+        configure()
+    start_logger()  # The acceptor starts its own logger after forking the workers
+    print_action("Worker " + str(worker_num) + " ready (pid " + str(os.getpid()) + ")")
+    global stats_label
+    stats_label = "worker " + str(worker_num)
+    start_stats_dump()
+    # The acceptor names the automatic rooms, it is told of every seat given back so it can send a player there
+    vacancy_lock = threading.Lock()
+    room_manager.add_vacancy_listener(lambda room: report_vacancy(vacancy_conn, vacancy_lock, room))
+
+    if server_mode == "ASYNC":
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        threading.Thread(target=receive_handoffs, args=(conn, loop), daemon=True).start()
         try:
-            chat_socket = socket(AF_INET, SOCK_DGRAM)
-            chat_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
-            chat_socket.bind((hostname, chat_port_min + player_num))
-            connection_socket.send("SEND MSG".encode())  # Notify client UDP socket created
-            # Receive and store chat message
-            chat_msg, address = chat_socket.recvfrom(recv_buffer)
-            chat_msg = chat_msg.decode()
-            chat_socket.close()
-        except OSError as e:
-            print_action("Socket error: " + str(e))
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        try:
+            receive_handoffs(conn, None)
+        except KeyboardInterrupt:
+            pass
+
+
+def report_vacancy(conn, conn_lock, room):
+    try:
+        with conn_lock:
+            conn.send(room.room_id)
+    except OSError:  # The acceptor has gone away
+        pass
+
+
+# Start a handler for every connection sent by the acceptor, until the acceptor goes away
+def receive_handoffs(conn, loop):
+    while True:
+        try:
+            (kind, addr, first_msg), connection_socket = sharding.recv_connection(conn)
+        except (EOFError, OSError):
+            if loop is not None:
+                loop.call_soon_threadsafe(loop.stop)
+            return
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(async_accept_handoff(connection_socket, kind, first_msg), loop)
+        elif kind == "CONTROL":
+            threading.Thread(target=client_thread, args=(connection_socket, addr, first_msg), daemon=True).start()
+        else:
+            threading.Thread(target=push_thread, args=(connection_socket, addr, first_msg), daemon=True).start()
+
+
+async def async_accept_handoff(connection_socket, kind, first_msg):
+    reader, writer = await asyncio.open_connection(sock=connection_socket)
+    if kind == "CONTROL":
+        await async_client_handler(reader, writer, first_msg)
+    else:
+        await async_push_handler(reader, writer, first_msg)
+
+
+# Accept connections on the push port, one thread per subscribed player
+def push_listener():
+    push_socket = socket(AF_INET, SOCK_STREAM)
+    push_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    push_socket.bind((hostname, push_port))
+    push_socket.listen(listen_backlog)
+    while True:
+        connection_socket, addr = push_socket.accept()
+        threading.Thread(target=push_thread, args=(connection_socket, addr), daemon=True).start()
+
+
+# Push the game state and chat messages of one subscribed player as they are produced
+def push_thread(connection_socket, addr, first_msg=None):
+    try:
+        if first_msg is None:
+            first_msg = protocol.recv_message(connection_socket)
+        game, player_num = parse_subscribe(first_msg)
+        if game is None:
+            protocol.send_message(connection_socket, "ERROR")
             connection_socket.close()
-            sys.exit(1)
-        # Determine chat receivers, chat types = ALL, TEAM, ENEMY, PLAYER
-        if tokens[1] == "ALL":
-            for player_num in game.players:
-                game_lock.acquire()
-                game.players[player_num].add_chat_message("[" + player.username + " (ALL)] " + chat_msg)
-                game_lock.release()
-        elif tokens[1] == "ALLIES":  # Your Team
-            for player_num in game.teams[player.team]:
-                game_lock.acquire()
-                game.players[player_num].add_chat_message("[" + player.username + " (ALLIES)] " + chat_msg)
-                game_lock.release()
-        elif tokens[1] == "ENEMY":  # An Enemy Team (send also to sender's team)
-            for player_num in game.teams[tokens[2]]:
-                game_lock.acquire()
-                game.players[player_num].add_chat_message("[" + player.username + " (FROM ENEMY - " + tokens[2] + ")] "
-                                                          + chat_msg)
-                game_lock.release()
-            for player_num in game.teams[tokens[3]]:
-                game_lock.acquire()
-                game.players[player_num].add_chat_message("[" + player.username + " (TO ENEMY - " + tokens[2] + ")] "
-                                                          + chat_msg)
-                game_lock.release()
-        print_action("Received Chat message from: " + str(player_num) + ": " + chat_msg.strip('\n'))
-        connection_socket.send("CHAT OK".encode())
+            return
+    except OSError as e:
+        print_action("Push connection error: " + str(e), "ERROR")
+        connection_socket.close()
+        return
+    push_queue = queue.Queue()
 
-    elif tokens[0] == "END_GAME":
+    game.subscribe(player_num, lambda kind, msg: push_queue.put((kind, msg)))
+    print_action("Player " + str(player_num) + " subscribed to pushed updates from: " + str(addr))
+
+    try:
+        protocol.send_message(connection_socket, "OK")
+        while True:
+            kind, msg = push_queue.get()
+            protocol.send_message(connection_socket, kind + ' ' + msg)
+            if ends_subscription(kind, msg):
+                break
+    except OSError as e:
+        print_action("Push connection error for " + str(player_num) + ": " + str(e), "ERROR")
+
+    game.unsubscribe(player_num)
+    connection_socket.close()
+
+
+# Write a pushed message to an event loop subscriber, closing the subscription after the end of the game
+def write_push(writer, kind, msg):
+    if writer.is_closing():
+        return
+    protocol.write_message(writer, kind + ' ' + msg)
+    if ends_subscription(kind, msg):
+        writer.close()  # Sends what was written first, the handler then reads the end of the stream and unsubscribes
+
+
+# Nothing is pushed to a subscriber after the end of the game
+def ends_subscription(kind, msg):
+    return kind == "GAME" and msg.startswith("GAME_END")
+
+
+# Parse a "SUBSCRIBE <room id> <player num>" request
+# Returns the game and player num, or (None, None) if the request is invalid
+def parse_subscribe(msg):
+    tokens = msg.split()
+    if len(tokens) != 3 or tokens[0] != "SUBSCRIBE" or not tokens[2].isdigit():
+        return None, None
+    room = room_manager.get_room(tokens[1])
+    player_num = int(tokens[2])
+    if room is None or player_num not in room.game.players or not room.game.game_start:
+        return None, None
+    return room.game, player_num
+
+
+# Serve every connection from a single asyncio event loop instead of one thread per client
+def async_main():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    server = loop.run_until_complete(asyncio.start_server(async_client_handler, hostname, server_port,
+                                                          backlog=listen_backlog, reuse_address=True))
+    if push_port:
+        push_server = loop.run_until_complete(asyncio.start_server(async_push_handler, hostname, push_port,
+                                                                   backlog=listen_backlog, reuse_address=True))
+    print_action('The Battleship Server is ready (event loop mode)')
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    if push_port:
+        push_server.close()
+        loop.run_until_complete(push_server.wait_closed())
+    # Disconnect clients that are still open and let their handlers finish
+    for writer in list(async_clients.values()):
+        writer.close()
+    if async_clients:
+        loop.run_until_complete(asyncio.wait(list(async_clients.keys())))
+    print_action("Closing the Battleship Server")
+    loop.close()
+
+
+# Event loop counterpart of client_thread for a single connection
+async def async_client_handler(reader, writer, first_msg=None):
+    addr = writer.get_extra_info('peername')
+    task = asyncio.current_task()
+    async_clients[task] = writer
+    print_action("*** Client entering now for: " + str(addr) + " ***")
+    room = None
+    phase = "JOIN"  # Phase of the connection, the time spent in each one is counted in phase_stats
+    phase_start = time.perf_counter()
+    try:
+        if first_msg is None:
+            protocol.write_message(writer, 'SRDY')
+            print_action('Sent: SRDY', "DEBUG")
+
+        # Get username, team choice and room, wait for game to enter setup phase
+        while True:
+            if first_msg is not None:
+                msg_tokens = first_msg.split()
+                first_msg = None
+            else:
+                msg_tokens = (await protocol.read_message(reader)).split()
+            if msg_tokens and msg_tokens[0] == "STATS" and room is None:
+                protocol.write_message(writer, get_stats_reply(addr, writer.get_extra_info('sockname')))
+                phase = None
+                return
+            if len(msg_tokens) < 3 or msg_tokens[0] != "JOIN":
+                raise ConnectionError("bad join request")
+            if room is None:
+                room, player_num = route_player(msg_tokens)
+                if room is None:
+                    protocol.write_message(writer, 'BUSY Battleship room is full, please try again later')
+                    print_action('Sent: BUSY Battleship room is full, please try again later')
+                    return
+                game = room.game
+            join_player(game, player_num, msg_tokens[1], msg_tokens[2])
+
+            await async_wait_for_phase(game, "SETUP", phase_wait)
+            if game.cancelled:
+                protocol.write_message(writer, "CANCEL")
+                return
+            elif game.game_setup:
+                protocol.write_message(writer, "OK " + str(player_num) + ' ' + room.room_id + '\n' +
+                                       get_rules_json(game))
+                break
+            else:
+                protocol.write_message(writer, "WAIT " + str(player_num) + ' ' + room.room_id)
+
+        phase, phase_start = "FLEET", record_phase(phase, phase_start)
+        # Receive ship locations from player
+        await async_process_coordinates(reader, writer, game, player_num)
+        set_player_ready(game)
+        phase, phase_start = "START", record_phase(phase, phase_start)
+
+        # Wait for game to start
+        while True:
+            await protocol.read_message(reader)
+            if await async_wait_for_phase(game, "PLAY", phase_wait):
+                protocol.write_message(writer, "OK")
+                break
+            else:
+                protocol.write_message(writer, "WAIT")
+        phase, phase_start = "SEND INFO", record_phase(phase, phase_start)
+
+        # Send to client the players, teams, and their initial board states
+        send_msg = await protocol.read_message(reader)
+        if send_msg == "SEND INFO":
+            protocol.write_message(writer, get_initial_game_state(game, player_num))
+        else:
+            print_action("Error: Bad request for game information", "ERROR")
+            return
+        phase, phase_start = "PLAY", record_phase(phase, phase_start)
+
+        while not game.all_players_ended():
+            # Receive requests from client and respond to them
+            if not await async_run_cmds(reader, writer, game, player_num):
+                break
+    except OSError as e:  # Includes ConnectionError once the client disconnects
+        print_action("Connection error for " + str(addr) + ": " + str(e), "ERROR")
+    finally:
+        print_action("*** Client closed for: " + str(addr) + " ***")
+        if phase is not None:  # The phase the connection ended in, by the game ending or a disconnect
+            record_phase(phase, phase_start)
+        if room is not None:
+            leave_room(room, player_num)
+        del async_clients[task]
+        await close_async_connection(writer)
+
+
+# Event loop counterpart of push_thread, messages are written straight to the subscriber's transport
+async def async_push_handler(reader, writer, first_msg=None):
+    task = asyncio.current_task()
+    async_clients[task] = writer
+    loop = asyncio.get_event_loop()
+    try:
+        if first_msg is None:
+            first_msg = await protocol.read_message(reader)
+        game, player_num = parse_subscribe(first_msg)
+        if game is None:
+            protocol.write_message(writer, "ERROR")
+            return
+        protocol.write_message(writer, "OK")
+
+        def push(kind, msg):
+            loop.call_soon_threadsafe(write_push, writer, kind, msg)
+
+        game.subscribe(player_num, push)
+        print_action("Player " + str(player_num) + " subscribed to pushed updates from: " +
+                     str(writer.get_extra_info('peername')))
+        try:
+            # Nothing else is read from a subscriber, wait until it disconnects
+            await reader.read()
+        finally:
+            game.unsubscribe(player_num)
+    except OSError as e:
+        print_action("Push connection error: " + str(e), "ERROR")
+    finally:
+        del async_clients[task]
+        await close_async_connection(writer)
+
+
+# Event loop counterpart of run_cmds, returns False once the client has disconnected
+async def async_run_cmds(reader, writer, game, player_num):
+    try:
+        cmd_bytes = await protocol.read_message_bytes(reader)
+    except ConnectionError:
+        return False
+    start = time.perf_counter()
+    tokens, replies = serve_command(game, player_num, cmd_bytes)
+    sent = protocol.write_messages(writer, replies)
+    await writer.drain()
+    record_command(tokens, start, len(cmd_bytes) + protocol.header.size, sent)
+    return True
+
+
+async def async_process_coordinates(reader, writer, game, player_num):
+    while True:
+        reply = store_fleet(game, player_num, await protocol.read_message(reader))
+        protocol.write_message(writer, reply)
+        if reply == "OK":
+            break
+
+
+async def close_async_connection(writer):
+    try:
+        await writer.drain()
+        writer.close()
+    except OSError:
+        pass
+
+
+# Wait without blocking the event loop until the game reaches the given phase
+# Returns False if the timeout expired first
+async def async_wait_for_phase(game, phase, timeout):
+    if game.reached_phase(phase):
+        return True
+    loop = asyncio.get_event_loop()
+    waiter = loop.create_future()
+
+    def wake_waiter():
+        if not waiter.done():
+            waiter.set_result(True)
+
+    def on_phase_change(new_phase):
+        if game.reached_phase(phase):
+            loop.call_soon_threadsafe(wake_waiter)
+
+    game.add_phase_listener(on_phase_change)
+    try:
+        await asyncio.wait_for(waiter, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        game.remove_phase_listener(on_phase_change)
+    return game.reached_phase(phase)
+
+
+# Route a player to the room named in their JOIN request (any open room if none is named)
+# Returns the room and the player's number in it, or (None, None) if the room is full
+def route_player(msg_tokens):
+    room_id = msg_tokens[3] if len(msg_tokens) > 3 else None
+    room, player_num = room_manager.join(room_id)
+    if room is not None:
+        print_action("Player " + str(player_num) + " routed to room " + room.room_id, "DEBUG")
+    return room, player_num
+
+
+def leave_room(room, player_num):
+    if room_manager.leave(room, player_num):
+        print_action("Room " + room.room_id + " closed")
+
+
+def log_new_room(room):
+    print_action("Room " + room.room_id + " created")
+    room.game.add_phase_listener(lambda phase: log_phase_change(room, phase))
+
+
+def log_phase_change(room, phase):
+    game = room.game
+    if phase == "SETUP":
+        print_action("Room " + room.room_id + ": Teams ready, Going to game setup")
+    elif phase == "PLAY":
+        print_action("Room " + room.room_id + ": Game setup complete, beginning game")
+    elif phase == "END" and game.cancelled:
+        print_action("Room " + room.room_id + ": Not enough teams, cancelling game")
+    elif phase == "END":
+        print_action("Room " + room.room_id + ": The game has ended.\nThe winning team is: " + game.team_winner)
+
+
+# Add a joining player and their team, repeated join requests are ignored
+def join_player(game, player_num, username, team):
+    with game.lock:
+        if game.player_join_count < game.player_count:
+            if player_num not in list(game.players.keys()):
+                game.add_player(Player(username, team, player_num, game.board_size, game.ships), player_num)
+                game.add_team(team, player_num)
+                game.player_joined()
+                if bot_players and game.player_join_count == game.player_count - bot_players:
+                    bots.add_bots(game, bot_players)
+
+
+def set_player_ready(game):
+    with game.lock:
+        game.player_ready()
+        bot_moves = bots.play_bot_moves(game)  # Bots on the first team move right away
+    log_bot_moves(bot_moves)
+
+
+def log_bot_moves(bot_moves):
+    for player_num, defender_num, row, col in bot_moves:
+        print_action("Bot move from: " + str(player_num) + ": " + str(defender_num) + ' ' + str(row) + '_' + str(col),
+                     "DEBUG")
+
+
+def end_player_game(game):
+    with game.lock:
         game.player_end_count += 1
-        connection_socket.send("OK".encode())
+
+
+# An UPDATE request may name the number of items the client already has, a count that is not a number is refused
+def cursor_valid(tokens):
+    return len(tokens) == 1 or (len(tokens) == 2 and tokens[1].isdecimal())
+
+
+# Check a "NEW_BOARD <player num> ALLY|ENEMY [since]" request, players only get the ALLY view of their own team
+def board_request_valid(game, player, tokens):
+    if not 3 <= len(tokens) <= 4 or not tokens[1].isdecimal() or int(tokens[1]) not in game.players:
+        return False
+    if len(tokens) == 4 and not tokens[3].isdecimal():
+        return False
+    return tokens[2] == "ENEMY" or (tokens[2] == "ALLY" and game.get_player(int(tokens[1])).team == player.team)
+
+
+# Verify if it's this player's turn and both players are alive, make the move if so
+# Returns the reply code for the client, INVALID_MOVE for a player or cell that is not in the game
+def process_move(game, player, tokens):
+    if len(tokens) != 4 or not all(token.isdecimal() for token in tokens[1:]):
+        return "INVALID_MOVE"
+    defender_num = int(tokens[1])
+    row = int(tokens[2])
+    col = int(tokens[3])
+    if defender_num not in game.players or not (1 <= row <= game.board_size and 1 <= col <= game.board_size):
+        return "INVALID_MOVE"
+    defender = game.get_player(defender_num)
+    with game.lock:  # Only moves in the same game wait on each other
+        move_ok = player.team == game.team_turn and not game.has_taken_turn(player) and player.is_alive and \
+            defender.is_alive
+        if move_ok:
+            game.make_move(player, defender, row, col)
+            bot_moves = bots.play_bot_moves(game)  # Bots whose turn comes next move before the lock is released
+    if move_ok:
+        print_action("Received move from: " + str(player.player_num) + ": " + tokens[1] + ' ' +
+                     tokens[2] + '_' + tokens[3], "DEBUG")
+        log_bot_moves(bot_moves)
+        return "MOVE_OK"
+    elif not player.is_alive:
+        return "YOU_ARE_DEAD"
+    elif not defender.is_alive:
+        return "ENEMY_IS_DEAD"
+    elif game.has_taken_turn(player) and player.team == game.team_turn:
+        return "ALREADY_TAKEN_TURN"
     else:
-        connection_socket.send("UNKNOWN CODE".encode())  # Can't identify code
+        return "NOT_YOUR_TURN"
+
+
+# Store a chat message in the game's chat log, receivers read (or are pushed) it from there
+# Chat types = ALL, ALLIES, ENEMY <enemy team> <own team>
+def deliver_chat(game, player, tokens, chat_msg):
+    if tokens[1] in ("ALL", "ALLIES"):
+        game.add_chat(tokens[1], player, None, chat_msg)
+    elif tokens[1] == "ENEMY":
+        game.add_chat("ENEMY", player, tokens[2], chat_msg)
+    print_action("Received Chat message from: " + str(player.player_num) + ": " + chat_msg.strip('\n'), "DEBUG")
+
+
+# Binary update of a player's board since the version the requester holds (None for the full board)
+# Enemies do not see ship cells, only waits on moves made against that player
+def get_board_update(game, player_num, since, hide_ships):
+    player = game.players[player_num]
+    with player.board_lock:
+        return player.get_board_update(since, hide_ships)
+
+
+# Serialize the ship coordinates of a player into JSON string
+def get_ship_coordinates_json(game, player_num):
+    return json.dumps(game.players[player_num].get_ship_coordinates())
+
+
+# Count a served request, commands outside stat_commands are counted together as UNKNOWN
+def record_command(tokens, start, bytes_in, bytes_out):
+    command = tokens[0] if tokens and tokens[0] in stat_commands else "UNKNOWN"
+    command_stats.record(command, time.perf_counter() - start, bytes_in, bytes_out)
+
 
+# Count the time a connection spent in a phase, returns the start of the next phase
+def record_phase(phase, phase_start):
+    now = time.perf_counter()
+    phase_stats.record(phase, now - phase_start)
+    return now
 
-def print_action(msg):
-    log_lock.acquire()
-    print(msg)
-    with open(logfile, "at") as f_log:
-        f_log.write(msg + '\n')
-    log_lock.release()
+
+# JSON reply to a STATS request, only answered for connections from this machine
+# (from a loopback address or from the address the connection was accepted on)
+def get_stats_reply(addr, local_addr):
+    if addr is None or not (addr[0].startswith("127.") or addr[0] == "::1" or addr[0] == local_addr[0]):
+        return "ERROR stats are only available from the server's machine"
+    reply = {"process": stats_label, "commands": command_stats.snapshot(), "phases": phase_stats.snapshot()}
+    if locks.profiling:
+        reply["locks"] = locks.lock_profile.snapshot()
+    return json.dumps(reply)
+
+
+# Write the request stats to the log every stats_interval seconds
+def start_stats_dump():
+    if stats_interval:
+        threading.Thread(target=dump_stats, daemon=True).start()
+
+
+def dump_stats():
+    while True:
+        time.sleep(stats_interval)
+        snapshot = command_stats.snapshot()
+        if snapshot:
+            print_action("Request stats (" + stats_label + ")\n" + format_snapshot("command", snapshot) + '\n' +
+                         format_snapshot("phase", phase_stats.snapshot()))
+        if locks.profiling:
+            print_action("Lock profile (" + stats_label + "), longest waits first\n" +
+                         locks.format_profile(locks.lock_profile.snapshot()))
+
+
+def start_logger():
+    global action_logger
+    action_logger = ActionLogger(logfile, log_flush_interval, log_level)
+
+
+# Queue a record for the log, levels = DEBUG, INFO, ERROR
+def print_action(msg, level="INFO"):
+    action_logger.log(msg, level)
 
 
 # Convert pathname to correct pathname
@@ -344,39 +980,83 @@ def get_pathname(pathname, cwd=os.getcwd()):
     return os.path.normpath(path)
 
 
-def process_coordinates(connection_socket, player_num):
-    global game
-    player = game.get_player(player_num)
-    ship_coords = {"carrier": "", "battleship": "", "cruiser": "", "submarine": "", "destroyer": ""}
-    for ship in ship_coords:
-        coord_tokens = connection_socket.recv(recv_buffer).decode().split()
-        print_action("Received from " + str(player_num) + ": " + str(coord_tokens))
+# Fleet from the FLEET setting, ship:size pairs separated by spaces, the classic fleet if empty
+# Returns None if a ship is not 1 to board_size cells long or the ships cover more than half the board
+def parse_fleet(text, board_size):
+    fleet = {}
+    for item in text.split():
+        ship, _, size = item.partition(':')
+        if not size.isdigit() or not 1 <= int(size) <= board_size or ship in fleet:
+            return None
+        fleet[ship] = int(size)
+    fleet = fleet or dict(Game.ship_size)
+    if max(fleet.values()) > board_size or sum(fleet.values()) * 2 > board_size * board_size:
+        return None
+    return fleet
 
-        game_lock.acquire()
-        player.set_ship_coordinates(coord_tokens[0], coord_tokens[1:])
-        for coord in coord_tokens[1:]:
-            c_tokens = coord.split('_')
-            player.set_grid_coordinate(int(c_tokens[0]), int(c_tokens[1]), Player.c_state["Ship"])
-        game_lock.release()
 
-        connection_socket.send("OK".encode())
+# Receive the player's fleet until a valid one is sent
+def process_coordinates(connection_socket, game, player_num):
+    while True:
+        reply = store_fleet(game, player_num, protocol.recv_message(connection_socket))
+        protocol.send_message(connection_socket, reply)
+        if reply == "OK":
+            break
+
+
+# Check a FLEET request and mark its ships on the player's grid, nothing is stored unless the whole fleet is valid
+# The request has one line per ship after the first: FLEET\n<ship> <row_col> <row_col> ...\n...
+# Returns the reply for the client, OK or ERROR and the reason
+def store_fleet(game, player_num, msg):
+    print_action("Received fleet from " + str(player_num) + ": " + msg.replace('\n', ' | '), "DEBUG")
+    lines = msg.split('\n')
+    fleet = {}
+    error = None
+    if lines[0].strip() != "FLEET":
+        error = "expected FLEET"
+    for line in lines[1:]:
+        tokens = line.split()
+        if error is None and tokens:
+            if tokens[0] in fleet:
+                error = tokens[0] + " placed twice"
+            fleet[tokens[0]] = tokens[1:]
+    error = error or placement_index.check_fleet(fleet, game.ship_size)
+    if error is not None:
+        print_action("Rejected fleet from " + str(player_num) + ": " + error)
+        return "ERROR " + error
+
+    player = game.get_player(player_num)
+    with player.board_lock:
+        for ship in game.ships:
+            player.set_ship_coordinates(ship, fleet[ship])
+    return "OK"
 
 
 # Send the game object as a json string to the client
-def send_initial_game_state(connection_socket, player_num):
+def get_initial_game_state(game, player_num):
+    json_string = get_game_state_json(game)
+    print_action("Sent initial game state to: " + str(player_num) + ' ' + str(len(json_string.encode())) + ' bytes',
+                 "DEBUG")
+    return json_string
+
+
+# Board size and fleet of the game, sent with the JOIN reply that starts the setup phase
+def get_rules_json(game):
+    return json.dumps({"board_size": game.board_size, "fleet": game.ship_size})
+
+
+# Serialize the players and teams into a json string
+def get_game_state_json(game):
     game_state = {"players": list(game.players.keys()),
                   "teams": game.teams,
-                  "first_turn": game.first_team_turn}
+                  "first_turn": game.first_team_turn,
+                  "board_size": game.board_size,
+                  "fleet": game.ship_size}
     for player_num in game_state["players"]:
         player = game.get_player(player_num)
         player_data = {str(player_num): (player.username, player.team)}
         game_state.update(player_data)
-
-    # Serialize the players and teams into a json string
-    json_string = json.dumps(game_state)  # Data serialized
-    connection_socket.send(json_string.encode())  # Data sent over
-    print_action("Sent initial game state to: " + str(player_num) + ' ' + str(sys.getsizeof(json_string.encode()))
-                 + ' bytes')
+    return json.dumps(game_state)  # Data serialized
 
 
 if __name__ == "__main__":
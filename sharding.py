@@ -0,0 +1,29 @@
+# Sharding - hands connections accepted by the acceptor process to the worker process that owns their room
+import socket
+import zlib
+from multiprocessing import reduction
+
+
+# Worker number owning a room, stable across processes and runs
+def shard_for_room(room_id, shard_count):
+    return zlib.crc32(room_id.encode()) % shard_count
+
+
+# Pass an accepted socket and its connection info to a worker process over a multiprocessing pipe
+# The caller keeps its own copy of the socket and should close it afterwards
+def send_connection(conn, worker_pid, sock, info):
+    if hasattr(sock, 'share'):  # Windows sockets are duplicated into the worker with share/fromshare
+        conn.send((info, sock.share(worker_pid)))
+    else:  # Everywhere else the file descriptor is sent over the pipe
+        conn.send((info, None))
+        reduction.send_handle(conn, sock.fileno(), worker_pid)
+
+
+# Receive a socket sent with send_connection, returns the connection info and the socket
+def recv_connection(conn):
+    info, shared = conn.recv()
+    if shared is not None:
+        sock = socket.fromshare(shared)
+    else:
+        sock = socket.socket(fileno=reduction.recv_handle(conn))
+    return info, sock
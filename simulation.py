@@ -0,0 +1,107 @@
+# Simulation - plays whole games in-process through Game.make_move, without sockets, threads or clients
+# Usage: python3 simulation.py [games] [players per team] [teams] [board size]
+import random
+import sys
+import time
+from game import Game
+from player import Player
+from placements import random_fleet
+
+
+# Set up a game in its play phase
+# teams: dict of team -> list of usernames, fleets: dict of username -> ship coords dict (random if missing)
+# board_size and fleet (dict of ship -> ship size) default to the classic board and fleet
+def new_game(teams, fleets=None, rng=random, board_size=10, fleet=None):
+    fleets = fleets or {}
+    game = Game(sum(len(usernames) for usernames in teams.values()), board_size, fleet)
+    for team in teams:
+        for username in teams[team]:
+            player_num = game.assign_player_num()
+            game.add_player(Player(username, team, player_num, game.board_size, game.ships), player_num)
+            game.add_team(team, player_num)
+            game.player_joined()
+    for player in game.players.values():
+        fleet = fleets.get(player.username) or random_fleet(rng, game.board_size, game.ship_size)
+        for ship in fleet:
+            player.set_ship_coordinates(ship, fleet[ship])
+        game.player_ready()
+    return game
+
+
+# Shoots random cells never shot before, shared by every attacker so no cell is shot twice
+class RandomShooter():
+    def __init__(self, game, rng=random):
+        self.game = game
+        self.rng = rng
+        self.targets = {}  # key: player num, value: cells of that player not shot yet
+
+    # Returns (defender num, row, col) of the attacker's next shot
+    def choose_move(self, attacker):
+        enemies = [player_num for player_num, player in self.game.players.items()
+                   if player.team != attacker.team and player.is_alive]
+        defender_num = self.rng.choice(enemies)
+        cells = self.targets.get(defender_num)
+        if cells is None:
+            size = self.game.board_size
+            cells = [(row, col) for row in range(1, size + 1) for col in range(1, size + 1)]
+            self.rng.shuffle(cells)
+            self.targets[defender_num] = cells
+        row, col = cells.pop()
+        return defender_num, row, col
+
+
+# Play a game set up by new_game until it ends, shooter picks the shots (RandomShooter by default)
+# Returns a summary dict, winner is None if the game stopped without one (no player could move or max_moves)
+def play_game(game, shooter=None, rng=random, max_moves=None):
+    if max_moves is None:  # Enough for every cell of every board to be shot twice
+        max_moves = 2 * game.board_size * game.board_size * len(game.players)
+    if shooter is None:
+        shooter = RandomShooter(game, rng)
+    moves = 0
+    while not game.game_end and moves < max_moves:
+        team = [game.players[player_num] for player_num in game.teams[game.team_turn]]
+        attackers = [player for player in team if player.is_alive and not game.has_taken_turn(player)]
+        if not attackers:
+            break
+        for attacker in attackers:
+            defender_num, row, col = shooter.choose_move(attacker)
+            game.make_move(attacker, game.players[defender_num], row, col)
+            moves += 1
+            if game.game_end or game.team_turn != attacker.team:
+                break
+    return {"winner": game.team_winner, "first_team": game.first_team_turn, "moves": moves,
+            "turns": game.turn_count, "events": len(game.events)}
+
+
+# Play many games, returns the wins of every team and the average game length
+def simulate(game_count, teams, shooter_class=RandomShooter, seed=None, board_size=10):
+    rng = random.Random(seed)
+    wins = {team: 0 for team in teams}
+    wins[None] = 0
+    total_moves = 0
+    for i in range(game_count):
+        game = new_game(teams, rng=rng, board_size=board_size)
+        result = play_game(game, shooter_class(game, rng), rng)
+        wins[result["winner"]] += 1
+        total_moves += result["moves"]
+    return {"games": game_count, "wins": wins, "average_moves": total_moves / max(game_count, 1)}
+
+
+def main():
+    game_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    team_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    team_count = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    board_size = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    teams = {team: [team + str(i) for i in range(team_size)] for team in Game.team_names(team_count)}
+
+    start = time.perf_counter()
+    summary = simulate(game_count, teams, board_size=board_size)
+    elapsed = time.perf_counter() - start
+    print("Played " + str(game_count) + " games in " + format(elapsed, ".2f") + "s (" +
+          format(elapsed / game_count * 1e6, ".0f") + " us per game)")
+    print("Wins: " + str(summary["wins"]))
+    print("Average moves per game: " + format(summary["average_moves"], ".1f"))
+
+
+if __name__ == "__main__":
+    main()
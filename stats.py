@@ -0,0 +1,103 @@
+# Stats - request counters and latency histograms, cheap enough to leave on in production
+# Latencies go into power of two buckets of microseconds, bucket N counts the latencies below 2^N us,
+# so recording one is a bit_length and a few additions under a lock held for no longer than that
+# Usage: python3 stats.py [worker num] prints the stats of a running server on this machine
+# and its lock profile when the server runs with LOCK_PROFILE on
+import configparser
+import json
+import os
+import sys
+import threading
+from socket import create_connection
+import protocol
+from locks import format_profile
+
+bucket_count = 25  # Last bucket holds everything from 2^23 us (8.4 seconds) up
+
+
+class CommandStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: command, value: [count, bytes in, bytes out, total seconds, max seconds, bucket counts]
+        self.commands = {}
+
+    def record(self, command, seconds, bytes_in=0, bytes_out=0):
+        bucket = min(int(seconds * 1000000).bit_length(), bucket_count - 1)
+        with self.lock:
+            entry = self.commands.get(command)
+            if entry is None:
+                entry = self.commands[command] = [0, 0, 0, 0.0, 0.0, [0] * bucket_count]
+            entry[0] += 1
+            entry[1] += bytes_in
+            entry[2] += bytes_out
+            entry[3] += seconds
+            if seconds > entry[4]:
+                entry[4] = seconds
+            entry[5][bucket] += 1
+
+    # Counters of every command, percentiles are the upper bound of the bucket holding them (milliseconds)
+    def snapshot(self):
+        with self.lock:
+            entries = {command: (entry[:5], list(entry[5])) for command, entry in self.commands.items()}
+        result = {}
+        for command, ((count, bytes_in, bytes_out, total, longest), buckets) in sorted(entries.items()):
+            result[command] = {"count": count, "bytes_in": bytes_in, "bytes_out": bytes_out,
+                               "mean_ms": total / count * 1000, "max_ms": longest * 1000,
+                               "p50_ms": bucket_percentile(buckets, count, 50),
+                               "p95_ms": bucket_percentile(buckets, count, 95),
+                               "p99_ms": bucket_percentile(buckets, count, 99),
+                               "histogram": buckets}
+        return result
+
+
+def bucket_percentile(buckets, count, pct):
+    seen = 0
+    for bucket, bucket_total in enumerate(buckets):
+        seen += bucket_total
+        if seen * 100 >= count * pct:
+            return (1 << bucket) / 1000
+    return (1 << (len(buckets) - 1)) / 1000
+
+
+# Text table of a snapshot, one line per command
+def format_snapshot(title, snapshot):
+    lines = [title.ljust(12) + "   count    bytes in   bytes out     mean ms     p50 <     p95 <     p99 <      max ms"]
+    for command, entry in snapshot.items():
+        line = command.ljust(12) + str(entry["count"]).rjust(8) + str(entry["bytes_in"]).rjust(12) + \
+               str(entry["bytes_out"]).rjust(12)
+        for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"):
+            line += format(entry[key], ".3f").rjust(12 if key in ("mean_ms", "max_ms") else 10)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+# Ask the server on this machine for its stats, the worker num picks the worker process when sharded
+def main():
+    configs = configparser.ConfigParser()
+    configs.read(os.path.join('server', 'conf', 'server.cfg'))
+    if not configs.has_section('SERVER'):
+        print("Error: Could not find config file. Exiting...")
+        sys.exit(1)
+    connection_socket = create_connection((configs['SERVER']['HOST_NAME'], int(configs['SERVER']['SERVER_PORT'])))
+    try:
+        if protocol.recv_message(connection_socket) != "SRDY":
+            print("Error: the server did not answer")
+            sys.exit(1)
+        protocol.send_message(connection_socket, "STATS " + (sys.argv[1] if len(sys.argv) > 1 else ""))
+        reply = protocol.recv_message(connection_socket)
+    finally:
+        connection_socket.close()
+    if reply.startswith("ERROR"):
+        print(reply)
+        sys.exit(1)
+    stats = json.loads(reply)
+    print("Request stats of the " + stats["process"])
+    print(format_snapshot("command", stats["commands"]))
+    print(format_snapshot("phase", stats["phases"]))
+    if "locks" in stats:
+        print("Lock profile, longest waits first")
+        print(format_profile(stats["locks"], 20))
+
+
+if __name__ == "__main__":
+    main()